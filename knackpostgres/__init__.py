@@ -1,3 +1,3 @@
 from .app import App
-from .translator import Translator, KnackTranslator
+from .translator import Translator, KnackTranslator, StreamingKnackTranslator
 from .loader import Loader
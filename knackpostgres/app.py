@@ -1,40 +1,61 @@
 """
 Convert a Knack application to a PostgreSQL Database.
 """
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
 import logging
 from pathlib import Path
 from pprint import pprint as print
-import shutil
 
 from knackpy import get_app_data
 
 from knackpostgres.fields.formula_field import FormulaField
+from knackpostgres.migration import Migration
+from knackpostgres.fields.child_connection_field import ChildConnectionField
 from knackpostgres.fields.concatenation_field import ConcatenationField
+from knackpostgres.fields.many_to_one_field import ManyToOneField
 from knackpostgres.tables.knack_table import KnackTable
 from knackpostgres.tables.metadata_table import MetaTable
 from knackpostgres.tables.reference_table import ReferenceTable
+from knackpostgres.tables.stored_formulas import StoredFormulas
 from knackpostgres.tables.view import View
 from knackpostgres.pages.scene import Scene
+from knackpostgres.utils.metadata_cache import MetadataCache
+from knackpostgres.utils.graph import topological_levels
 from knackpostgres.utils.utils import valid_pg_name
 
 
 APP_ATTRIBUTES = [
     # todo: implement explicit setting
     {"name": "app_id", "source": "built_in"},
+    {"name": "cache_dir", "source": "built_in"},
+    {"name": "generated_subfields", "source": "built_in"},
     {"name": "id", "source": "knack"},
     {"name": "metadata", "source": "built_in"},
     {"name": "metadata_schema", "source": "built_in"},
     {"name": "metadata_knack", "source": "built_in"},
     {"name": "name", "source": "knack"},
+    {"name": "narrow_types", "source": "built_in"},
+    {"name": "normalize_one_to_many", "source": "built_in"},
     {"name": "obj_filter", "source": "built_in"},
+    {"name": "materialized_views", "source": "built_in"},
+    {"name": "max_age", "source": "built_in"},
     {"name": "obj_lookup", "source": "built_in"},
+    {"name": "offline", "source": "built_in"},
     {"name": "objects", "source": "knack"},
     {"name": "scenes", "source": "knack"},
     {"name": "schema", "source": "built_in"},
+    {"name": "stored_formulas", "source": "built_in"},
     {"name": "tables", "source": "built_in"},    
     {"name": "views", "source": "built_in"},
 ]
 
+# content hashes of the files written by `App.to_sql`
+MANIFEST_FILENAME = "manifest.json"
+
+
 class App:
     """
     Knack application wrapper. Stores app meta data, tables, fields, etc.
@@ -48,14 +69,56 @@ class App:
         return f"<App {self.name}> ({len(self.objects)} objects)"
 
     def __init__(
-        self, app_id, obj_filter=None, schema="public", metadata_schema="_meta",
+        self,
+        app_id,
+        obj_filter=None,
+        schema="public",
+        metadata_schema="_meta",
+        cache_dir=None,
+        max_age=None,
+        offline=False,
+        metadata=None,
+        materialized_views=False,
+        stored_formulas=False,
+        normalize_one_to_many=False,
+        narrow_types=False,
+        generated_subfields=False,
     ):
 
         self.app_id = app_id
 
+        # optionally cache app metadata on disk, and reuse it for up to `max_age`
+        # seconds. in `offline` mode, the app is built from the cache regardless of age
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.offline = offline
+
+        # app metadata may be provided directly, e.g. by `App.from_file`
+        self._metadata = metadata
+
         # optionally include only object keys specified in filter
         self.obj_filter = obj_filter
 
+        # optionally create materialized views, which must be refreshed with
+        # `Loader.refresh_views` when data changes
+        self.materialized_views = materialized_views
+
+        # optionally store formula fields as table columns, maintained by triggers,
+        # rather than computing them in views
+        self.stored_formulas = stored_formulas
+
+        # optionally store one-to-many connections as a scalar column on the child
+        # table, rather than an array of child ids on the parent table
+        self.normalize_one_to_many = normalize_one_to_many
+
+        # optionally use narrower column types: `INTEGER` connection keys, and types
+        # profiled from the data by `Loader.load_app`
+        self.narrow_types = narrow_types
+
+        # optionally store address and name subfields, e.g. latitude and zip, as
+        # indexed, generated columns. see `GENERATED_SUBFIELDS`
+        self.generated_subfields = generated_subfields
+
         # all data will be written to `schema`, except for metadata, which writes to 
         # `metadata_schema`
         self.schema = valid_pg_name(schema)
@@ -65,46 +128,262 @@ class App:
 
         # assign knack metadata to class attributes
         for key in self.metadata_knack:
-            setattr(self, key, self.metadata_knack[key])
+            if isinstance(getattr(type(self), key, None), property):
+                # our lazily-built attributes keep the knack data at `<key>_knack`
+                setattr(self, f"{key}_knack", self.metadata_knack[key])
+            else:
+                setattr(self, key, self.metadata_knack[key])
+
+        # indexes of knack keys, for constant-time lookups across the app. these are
+        # maintained by `_add_tables`
+        self._fields_by_key = {}
+        self._tables_by_field_key = {}
+        self._tables_by_object_key = {}
+
+        # (table name, field name): field. fields are added to tables throughout
+        # `_build_tables`, so this is indexed once they are built
+        self._fields_by_name = None
+
+        # tables, views, scenes, and metadata are expensive to build, so they are
+        # built on first access. see the properties of the same name
+        self._tables = None
+        self._obj_lookup = None
+        self._views = None
+        self._scenes = None
+        self._metadata_tables = None
+
+        # formulae are parsed once, either when tables are built (for stored
+        # formulas) or when views are first accessed
+        self._formulae_handled = False
+
+        self.schema_sql = self._generate_schema_sql()
+
+        logging.info(self)
+
+    @property
+    def tables(self):
+        if self._tables is None:
+            self._build_tables()
+
+        return self._tables
+
+    @property
+    def obj_lookup(self):
+        if self._obj_lookup is None:
+            self._build_tables()
+
+        return self._obj_lookup
+
+    @property
+    def views(self):
+        """ These are database views, not Knack "views" ;) """
+        if self._views is None:
+            self._handle_formulae()
+            self._views = self._handle_views()
+
+        return self._views
+
+    @views.setter
+    def views(self, views):
+        self._views = views
 
-        self.tables = self._generate_tables()
+    @property
+    def scenes(self):
+        if self._scenes is None:
+            self._scenes = self._handle_scenes()
 
-        self.obj_lookup = self._generate_obj_lookup()
+        return self._scenes
+
+    @property
+    def metadata(self):
+        if self._metadata_tables is None:
+            self._metadata_tables = self._set_metadata()
+
+        return self._metadata_tables
+
+    def _build_tables(self):
+        self._tables = []
+
+        tables = self._generate_tables()
+
+        self._obj_lookup = self._generate_obj_lookup(tables)
+
+        if self.obj_filter:
+            # drop connections to objects outside of the filter
+            for table in tables:
+                table.prune_connections(self._obj_lookup)
+
+        self._add_tables(tables)
 
         self._update_one_to_many_relationships()
 
-        self.tables += self._update_many_to_many_relationships()
+        if self.normalize_one_to_many:
+            self._normalize_one_to_many_relationships()
 
-        self._handle_formulae()
+        self._add_tables(self._update_many_to_many_relationships())
 
-        # These are database views, not Knack "views" ;)
-        self.views = (
-            self._handle_views()
-        )
+        if self.narrow_types:
+            self._narrow_key_types()
 
-        self.scenes = self._handle_scenes()
+        if self.generated_subfields:
+            for table in self.tables:
+                table.add_generated_fields()
 
-        self.metadata = self._set_metadata()
+        if self.stored_formulas:
+            # stored formulas are table columns, so they must be handled before any
+            # table sql is generated
+            self._handle_formulae()
 
-        self.schema_sql = self._generate_schema_sql()
+        return self._tables
 
-        logging.info(self)
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Build an App from a saved Knack metadata JSON file, without fetching anything
+        from Knack. Accepts files written by `App.save_metadata` or by the metadata cache.
+        """
+        with open(path, "r") as fin:
+            metadata = json.load(fin)
+
+        # cache files wrap the metadata with its fetch time and hash
+        metadata = metadata.get("metadata", metadata)
+
+        return cls(metadata["id"], metadata=metadata, **kwargs)
 
-    def to_sql(self, path="sql", overwrite=False):
+    def save_metadata(self, path):
+        """ Write the app's Knack metadata to a JSON file, for use with `App.from_file` """
+        with open(path, "w") as fout:
+            json.dump(self.metadata_knack, fout)
+
+    def to_sql(
+        self, path="sql", overwrite=False, bundle=False, compress=False, workers=None
+    ):
         """
         Write application SQL commands to file. Alternatively, use the `Loader` class
         to connect/write directly from the `App` class.
+
+        By default, one file is written per schema, table, and view. With `bundle`, a
+        single deploy script is written instead, which creates the schemas, tables and
+        views in dependency order and can be applied in one go with `psql -f`. With
+        `compress`, it is gzipped.
+
+        A manifest of each file's content hash is kept at `<path>/manifest.json`, and
+        files which have not changed are not rewritten. With `overwrite`, any other
+        files in `path`, e.g. from previous runs, are removed. Files are generated
+        and written by `workers` threads.
         """
+        files = self._generate_sql_files(bundle, compress)
+
+        manifest_path = Path(path) / MANIFEST_FILENAME
+
+        manifest = self._read_manifest(manifest_path)
+
         if overwrite:
-            shutil.rmtree(path)
+            # remove files which are no longer generated, whether or not they are in
+            # the manifest. the hashes of the rest are kept, so that unchanged files
+            # are not rewritten
+            for file_path in self._written_files(path):
+                file_name = file_path.relative_to(path).as_posix()
+
+                if file_name != MANIFEST_FILENAME and file_name not in files:
+                    file_path.unlink()
+
+            manifest = {
+                file_name: sql_hash
+                for file_name, sql_hash in manifest.items()
+                if file_name in files
+            }
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = executor.map(
+                lambda item: self._write_sql_file(path, *item, manifest),
+                files.items(),
+            )
+            manifest.update(zip(files, hashes))
+
+        manifest_path.parent.mkdir(exist_ok=True, parents=True)
+
+        with open(manifest_path, "w") as fout:
+            json.dump(manifest, fout, indent=2, sort_keys=True)
 
-        self._write_sql(self.schema_sql, path, "schema", self.schema)
+        return manifest
+
+    def _generate_sql_files(self, bundle, compress):
+        """ Returns a dict of file name: sql generator function """
+        if bundle:
+            file_name = "deploy.sql.gz" if compress else "deploy.sql"
+            return {file_name: self._bundle_sql}
+
+        files = {f"schema/{self.schema}.sql": lambda: self.schema_sql}
 
         for table in self.tables:
-            self._write_sql(table.to_sql(), path, "tables", table.name_postgres)
+            files[f"tables/{table.name_postgres}.sql"] = lambda table=table: "\n".join(
+                [table.to_sql()] + table.index_sql()
+            )
 
         for view in self.views:
-            self._write_sql(view.sql, path, "views", view.name)
+            files[f"views/{view.name}.sql"] = lambda view=view: view.sql
+
+        return files
+
+    def _bundle_sql(self):
+        # table, index and view sql is unqualified, so it must be run in the app's
+        # schema. `SET LOCAL` leaves the caller's search path alone after commit
+        sql = [
+            "BEGIN;",
+            self.schema_sql,
+            f"SET LOCAL search_path TO {self.schema}, public;",
+        ]
+        sql += [table.to_sql() for table in self.metadata + self.tables]
+        sql += [index.to_sql() for index in self.indexes()]
+        sql += [view.sql for view in self.sequence_views()]
+        sql.append("COMMIT;")
+        return "\n\n".join(sql)
+
+    def _written_files(self, path):
+        if not Path(path).exists():
+            return []
+
+        return [file_path for file_path in Path(path).rglob("*") if file_path.is_file()]
+
+    def _read_manifest(self, manifest_path):
+        try:
+            with open(manifest_path, "r") as fin:
+                return json.load(fin)
+
+        except FileNotFoundError:
+            return {}
+
+    def _write_sql_file(self, path, file_name, generate_sql, manifest):
+        """ Generate and write a sql file, unless its content is unchanged. Returns its hash """
+        sql = generate_sql()
+
+        sql_hash = hashlib.sha256(sql.encode()).hexdigest()
+
+        file_path = Path(path) / file_name
+
+        if manifest.get(file_name) == sql_hash and file_path.exists():
+            return sql_hash
+
+        file_path.parent.mkdir(exist_ok=True, parents=True)
+
+        if file_name.endswith(".gz"):
+            # a fixed mtime keeps the output identical for identical sql
+            with open(file_path, "wb") as fout:
+                with gzip.GzipFile(fileobj=fout, mode="wb", mtime=0) as gzout:
+                    gzout.write(sql.encode())
+        else:
+            with open(file_path, "w") as fout:
+                fout.write(sql)
+
+        return sql_hash
+
+    def migration_sql(self, deployed, drop_columns=True):
+        """
+        Generate the statements needed to migrate a deployed schema to this app's
+        schema. See `Migration` and `Loader.migrate`.
+        """
+        return Migration(self, deployed, drop_columns=drop_columns).sql
 
     def _generate_schema_sql(self):
         schema = [self.schema, self.metadata_schema]
@@ -114,19 +393,31 @@ class App:
         ]
         return "\n".join(schema_sql)
 
-    def _write_sql(self, sql, path, subdir, name_attr, method="w"):
+    def _get_app_data(self):
+        if self._metadata:
+            return self._metadata
+
+        cache = MetadataCache(self.cache_dir) if self.cache_dir else None
+
+        if cache:
+            metadata = cache.get(
+                self.app_id, max_age=None if self.offline else self.max_age
+            )
 
-        file_path = Path(path) / subdir
+            if metadata:
+                return metadata
 
-        file_path.mkdir(exist_ok=True, parents=True)
+        if self.offline:
+            raise FileNotFoundError(
+                f"No cached metadata found for app {self.app_id} in offline mode."
+            )
 
-        file_path = file_path / f"{name_attr}.sql"
+        metadata = get_app_data(self.app_id)
 
-        with open(file_path, method) as fout:
-            fout.write(sql)
+        if cache:
+            cache.put(self.app_id, metadata)
 
-    def _get_app_data(self):
-        return get_app_data(self.app_id)
+        return metadata
 
     def _generate_tables(self):
         if self.obj_filter:
@@ -138,12 +429,39 @@ class App:
         else:
             return [KnackTable(obj, obj["name"], self.schema) for obj in self.objects]
 
+    def view_levels(self):
+        """
+        Some views select formula fields from other views. Sort the views into
+        levels with a topological sort of their `depends_on` graph. Each level only
+        depends on the levels before it, so the views within a level can be created
+        concurrently.
+
+        Raises `DependencyCycleError` if views depend on each other in a loop, which
+        postgres could never create.
+        """
+        views = {view.name: view for view in self.views}
+
+        levels = topological_levels(
+            {name: view.depends_on for name, view in views.items()}
+        )
+
+        return [[views[name] for name in level] for level in levels]
+
+    def sequence_views(self):
+        """
+        Return the views in an order in which each view is created after its
+        dependencies.
+        """
+        return [view for level in self.view_levels() for view in level]
+
     def _handle_views(self):
-        return [View(table) for table in self.tables]
+        return [
+            View(table, materialized=self.materialized_views) for table in self.tables
+        ]
 
-    def _generate_obj_lookup(self):
+    def _generate_obj_lookup(self, tables):
         """ The obj_lookup allows us to find connected object keys across the entire app """
-        return {table.key_knack: table.name_postgres for table in self.tables}
+        return {table.key_knack: table.name_postgres for table in tables}
 
     def _update_one_to_many_relationships(self):
         # sets field definitions for relationship fields,
@@ -153,6 +471,30 @@ class App:
             # update field map referecnces in table (used by translator)
             table.create_field_map()
 
+    def _normalize_one_to_many_relationships(self):
+        """ Move one-to-many connection arrays to scalar columns of the child tables """
+        for table in self.tables:
+            # normalizing a self-connection adds a field to the table itself
+            for field in list(table.fields):
+                if isinstance(field, ManyToOneField) and field.data_type.endswith("[]"):
+                    rel_obj = field.relationship_knack["object"]
+                    field.normalize(self.find_table_from_object_key(rel_obj))
+
+    def _narrow_key_types(self):
+        """
+        Connection columns hold the ids of `SERIAL` primary keys, so they are
+        `INTEGER`s rather than `NUMERIC`s
+        """
+        for table in self.tables:
+            for field in table.column_fields():
+                if field.is_primary_key:
+                    continue
+
+                if table.associative or isinstance(
+                    field, (ManyToOneField, ChildConnectionField)
+                ):
+                    field.data_type = field.data_type.replace("NUMERIC", "INTEGER")
+
     def _update_many_to_many_relationships(self):
         """
         Ah, many-to-many relationships. To handle these, we need
@@ -197,6 +539,9 @@ class App:
         return fields
 
     def _handle_formulae(self):
+        if self._formulae_handled:
+            return self.tables
+
         for table in self.tables:
             for field in table.fields:
                 if isinstance(field, FormulaField) or isinstance(
@@ -204,38 +549,136 @@ class App:
                 ):
                     field.handle_formula(self)
 
+        if self.stored_formulas:
+            self._store_formulas()
+
+        # only once every formula is handled, so that a failure can be retried
+        self._formulae_handled = True
+
         return self.tables
 
-    def find_table_from_object_key(self, key, return_attr=None):
-        for table in self.tables:
-            if table.key_knack == key:
-                return table if not return_attr else getattr(table, return_attr)
-        return None
+    def _store_formulas(self):
+        """
+        Store every formula which can be stored. A formula of a formula can only be
+        stored once the formula it aggregates is, so we repeat until nothing changes
+        """
+        formulas = [
+            field
+            for table in self.tables
+            for field in table.fields
+            if isinstance(field, FormulaField)
+        ]
 
-    def find_field_from_field_key(self, key, return_attr=None):
+        while True:
+            storable = [
+                field for field in formulas if not field.stored and field.is_storable()
+            ]
+
+            if not storable:
+                break
+
+            for field in storable:
+                field.store()
+
+    def indexes(self):
+        """ The `Index`es of all app tables """
+        return [index for table in self.tables for index in table.indexes()]
+
+    def stored_formula_levels(self):
         """
-        from a knack field key, track down the `Field` instance
+        `StoredFormulas` of each table with stored formulas, sorted into levels.
+        Formulas of stored formulas must be backfilled after the levels before them.
         """
-        for table in self.tables:
+        formulas = {
+            table.name_postgres: StoredFormulas(table)
+            for table in self.tables
+            if any(
+                isinstance(field, FormulaField) and field.stored for field in table.fields
+            )
+        }
+
+        levels = topological_levels(
+            {name: stored.depends_on for name, stored in formulas.items()}
+        )
+
+        return [[formulas[name] for name in level] for level in levels]
+
+    def _add_tables(self, tables):
+        """ Add tables to the app and index their knack object and field keys """
+        for table in tables:
+            self._tables.append(table)
+
+            # the first table or field with a given key wins, as in a full scan
+            self._tables_by_object_key.setdefault(table.key_knack, table)
+
             for field in table.fields:
                 try:
-                    if field.key_knack == key:
-                        try:
-                            return (
-                                field
-                                if not return_attr
-                                else getattr(field, return_attr)
-                            )
-                        except AttributeError:
-                            # we found the field, but it's missing the requested attribute
-                            return None
+                    key = field.key_knack
+
                 except AttributeError:
                     # primary key fields do not have `knack` field propeties and are ignored
                     continue
 
-        else:
+                self._fields_by_key.setdefault(key, field)
+                self._tables_by_field_key.setdefault(key, table)
+
+        return self._tables
+
+    def _ensure_tables(self):
+        """ The lookups below are indexed as tables are built, so build them first """
+        if self._tables is None:
+            self._build_tables()
+
+    def find_table_from_object_key(self, key, return_attr=None):
+        self._ensure_tables()
+
+        table = self._tables_by_object_key.get(key)
+
+        if not table:
+            return None
+
+        return table if not return_attr else getattr(table, return_attr)
+
+    def find_field_from_field_key(self, key, return_attr=None):
+        """
+        from a knack field key, track down the `Field` instance
+        """
+        self._ensure_tables()
+
+        field = self._fields_by_key.get(key)
+
+        if not field:
+            return None
+
+        try:
+            return field if not return_attr else getattr(field, return_attr)
+
+        except AttributeError:
+            # we found the field, but it's missing the requested attribute
+            return None
+
+    def find_field_from_name(self, table_name, field_name, return_attr=None):
+        """
+        From postgres table and field names, track down the `Field` instance
+        """
+        self._ensure_tables()
+
+        if self._fields_by_name is None:
+            self._fields_by_name = {}
+
+            for table in self._tables:
+                for field in table.fields:
+                    self._fields_by_name.setdefault(
+                        (table.name_postgres, field.name_postgres), field
+                    )
+
+        field = self._fields_by_name.get((table_name, field_name))
+
+        if not field:
             return None
 
+        return field if not return_attr else getattr(field, return_attr)
+
     def find_table_from_field_key(self, key, return_attr=None):
         """
         From a knack field key, track down the table in which that field lives """
@@ -246,23 +689,42 @@ class App:
         except AttributeError:
             pass
 
-        for table in self.tables:
-            for field in table.fields:
-                if field.key_knack == key:
-                    # we found it :)
-                    return table if not return_attr else getattr(table, return_attr)
+        self._ensure_tables()
 
-        # no table found that contains this key
-        return None
+        table = self._tables_by_field_key.get(key)
+
+        if not table:
+            # no table found that contains this key
+            return None
+
+        return table if not return_attr else getattr(table, return_attr)
 
     def _handle_scenes(self):
         scenes = []
 
-        for scene in self.scenes:
+        for scene in self.scenes_knack:
+            if self.obj_filter:
+                # keep only the knack views of filtered objects, and the scenes that have them
+                scene = dict(
+                    scene,
+                    views=[view for view in scene["views"] if self._in_obj_filter(view)],
+                )
+
+                if not scene["views"]:
+                    continue
+
             scenes.append(Scene(scene))
 
         return scenes
 
+    def _in_obj_filter(self, view):
+        try:
+            return view["source"]["object"] in self.obj_filter
+
+        except (KeyError, TypeError):
+            # views without a source object (menus, rich text, etc.)
+            return False
+
 
     def _set_metadata(self):
         """
@@ -272,10 +734,10 @@ class App:
         metadata = []
         fields = [field for table in self.tables for field in table.fields]
         metatable_fields = MetaTable(fields, "_fields", self.metadata_schema)
-        metatable_fields.to_sql()
         metadata.append(metatable_fields)
         views = [view for scene in self.scenes for view in scene._views]
         metatable_views = MetaTable(views, "_views", self.metadata_schema)
-        metatable_views.to_sql()
         metadata.append(metatable_views)
+        metatable_indexes = MetaTable(self.indexes(), "_indexes", self.metadata_schema)
+        metadata.append(metatable_indexes)
         return metadata
@@ -122,12 +122,12 @@ FIELD_DEFINITIONS = {
         "is_standard_equation": False,
     },
     "address": {
-        "type_postgres": "JSON",
+        "type_postgres": "JSONB",
         "is_formula": False,
         "is_standard_equation": False,
     },
     "name": {
-        "type_postgres": "JSON",
+        "type_postgres": "JSONB",
         "is_formula": False,
         "is_standard_equation": False,
     },
@@ -157,3 +157,22 @@ FIELD_DEFINITIONS = {
         "is_standard_equation": False,
     },
 }
+
+# subfields of JSONB fields which may be stored as generated columns, named
+# `<field name>_<subfield key>`. see `App(generated_subfields=True)`
+GENERATED_SUBFIELDS = {
+    "address": {
+        "columns": [
+            {"key": "latitude", "data_type": "DOUBLE PRECISION"},
+            {"key": "longitude", "data_type": "DOUBLE PRECISION"},
+            {"key": "zip", "data_type": "TEXT"},
+            {"key": "city", "data_type": "TEXT"},
+        ],
+        # latitude and longitude are indexed together, for bounding box lookups
+        "indexes": [["latitude", "longitude"], ["zip"], ["city"]],
+    },
+    "name": {
+        "columns": [{"key": "last", "data_type": "TEXT"}],
+        "indexes": [["last"]],
+    },
+}
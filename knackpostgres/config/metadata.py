@@ -39,6 +39,14 @@ METADATA_FIELDS = {
         { "name": "columns", "data_type": "JSON", "accessor": "columns"},
         { "name": "groups", "data_type": "JSON", "accessor": "groups"},
     ],
+    "_indexes" : [
+        # extracts metadata from an `Index` class
+        {"name": "name", "data_type": "TEXT", "accessor": "name"},
+        {"name": "table_name", "data_type": "TEXT", "accessor": "table_name"},
+        {"name": "columns", "data_type": "TEXT[]", "accessor": "columns"},
+        {"name": "method", "data_type": "TEXT", "accessor": "method"},
+        {"name": "reason", "data_type": "TEXT", "accessor": "reason"},
+    ],
     "_pages" : [
         {"name": "limit_profile_access", "data_type": "BOOLEAN"},
         {"name": "groups", "data_type": "JSON"},
@@ -1,2 +1,5 @@
 class ValidationError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class DependencyCycleError(Exception):
+    pass
@@ -38,15 +38,23 @@ class Field:
 
         return f"DEFAULT {default}"
 
-    def to_sql(self):
+    def to_sql(self, constraints=True):
+        """
+        Column definition sql. If `constraints` is False the primary key and any
+        constraints are omitted, so they can be added after data has been loaded.
+        """
+        self.sql = self.column_sql(constraints=constraints)
+        return self.sql
 
-        pk = "PRIMARY KEY" if self.is_primary_key else ""
+    def column_sql(self, constraints=True):
+        pk = "PRIMARY KEY" if self.is_primary_key and constraints else ""
 
         default = self._format_default()
 
-        constraints = " ".join(self.constraints) if self.constraints else ""
+        constraints_sql = (
+            " ".join(self.constraints) if self.constraints and constraints else ""
+        )
 
-        sql = f"{self.name_postgres} {self.data_type} {pk} {default} {constraints}".strip()
-        
-        self.sql = clean_whitespace(sql)
-        return self.sql
+        sql = f"{self.name_postgres} {self.data_type} {pk} {default} {constraints_sql}".strip()
+
+        return clean_whitespace(sql)
@@ -0,0 +1,18 @@
+from knackpostgres.fields._field import Field
+
+
+class ChildConnectionField(Field):
+    """
+    The scalar column on the child table of a normalized one-to-many connection,
+    which references the parent record. See `ManyToOneField.normalize`.
+    """
+
+    def __init__(self, parent_field, table):
+        self.parent_field = parent_field
+
+        # the parent table
+        self.rel_table_name = parent_field.table.name_postgres
+
+        name = f"{parent_field.base_name}_rel_{self.rel_table_name}_id"
+
+        super().__init__({"name": name, "data_type": "NUMERIC"}, name, table)
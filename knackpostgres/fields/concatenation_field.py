@@ -37,6 +37,11 @@ class ConcatenationField(KnackField):
     def handle_formula(self, app, grammar="concatenation"):
         self.app = app
         self._get_fieldmap()
+
+        if self.missing_fields:
+            # the formula references objects excluded by the app's `obj_filter`
+            return self
+
         self.parser = get_parser(grammar)
         self.tree = self.parser.parse(self.equation)
         self._process_methods()
@@ -124,6 +129,7 @@ class ConcatenationField(KnackField):
         self.fieldmap = {}
         self.tables = []
         self.connection_fields = []
+        self.missing_fields = []
 
         fieldname_matches = re.findall(FIELD_SEARCH_EXCLUDE_BRACES, self.equation)
 
@@ -148,9 +154,17 @@ class ConcatenationField(KnackField):
 
             target_field = self.app.find_field_from_field_key(target_fieldname)
 
+            if not target_field:
+                self.missing_fields.append(target_fieldname)
+                continue
+
             if conn_fieldname:
                 conn_field = self.app.find_field_from_field_key(conn_fieldname)
 
+                if not conn_field:
+                    self.missing_fields.append(conn_fieldname)
+                    continue
+
                 self.connection_fields.append(conn_field)
 
             if target_field.table.name_postgres not in self.tables:
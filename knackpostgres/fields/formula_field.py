@@ -9,6 +9,9 @@ class FormulaField(KnackField):
     def __init__(self, data, name, table):
         super().__init__(data, name, table)
 
+        # stored formulas are columns of their table. see `store`
+        self.stored = False
+
     def handle_formula(self, app):
 
         if FIELD_DEFINITIONS[self.type_knack].get("is_standard_equation"):
@@ -53,14 +56,19 @@ class FormulaField(KnackField):
 
         if self.method == "COUNT":
             # for counts, always just count the primary key
+            self.dest_field = None
             self.dest_field_name = "id"
 
         else:
             dest_field_key = self.format_knack["field"]["key"]
 
-            self.dest_field_name = app.find_field_from_field_key(
-                dest_field_key, return_attr="name_postgres"
-            )
+            self.dest_field = app.find_field_from_field_key(dest_field_key)
+
+            if not self.dest_field:
+                # the field is in an object excluded by the app's `obj_filter`
+                return None
+
+            self.dest_field_name = self.dest_field.name_postgres
 
         try:
             # count connections key is a string
@@ -72,8 +80,16 @@ class FormulaField(KnackField):
 
         self.connection_field = app.find_field_from_field_key(self.connection_field_key)
 
+        if not self.connection_field:
+            # the connection was pruned by the app's `obj_filter`
+            return None
+
         self.dest_join_field = self.connection_field.name_postgres
 
+        if getattr(self.connection_field, "normalized", False):
+            # the child table references the host
+            self.dest_join_field = self.connection_field.child_field.name_postgres
+
         if self.connection_field.relationship_type == "many_to_many":
 
             return self._many_to_many_formula(app)
@@ -81,10 +97,23 @@ class FormulaField(KnackField):
             return self._one_to_many_formula(app)
 
     def _many_to_many_formula(self, app):
-        self.rel_table_name = self.connection_field.rel_table_name
+        # the formula may live on either side of the connection
+        if self.table.name_postgres == self.connection_field.table.name_postgres:
+            self.rel_table_name = self.connection_field.rel_table_name
+        else:
+            self.rel_table_name = self.connection_field.table.name_postgres
+
         self.rel_table_view_name = f"{self.rel_table_name}_view"
+        self.rel_base_table_name = self.rel_table_name
+        self.rel_view_name = self.rel_table_view_name
         self.reference_table_name = self.connection_field.reference_table_name
 
+        # the reference table column which holds the host id
+        self.join_table_name = self.reference_table_name
+        self.join_column = f"{self.host_table_name}_id"
+
+        self._set_source()
+
         return f"""(SELECT {self.method}({self.rel_table_view_name}.{self.dest_field_name}) as {self.name_postgres}
             FROM {self.rel_table_view_name}
             JOIN {self.reference_table_name} 
@@ -99,9 +128,78 @@ class FormulaField(KnackField):
         else:
             self.rel_table_name = self.connection_field.table.name_postgres
 
+        self.rel_base_table_name = self.rel_table_name
         self.rel_table_name = f"{self.rel_table_name}_view"
+        self.rel_view_name = self.rel_table_name
+
+        # the related table column which holds the host id
+        self.join_table_name = self.rel_base_table_name
+        self.join_column = self.dest_join_field
+
+        self._set_source()
 
         return f"""(SELECT {self.method}({self.rel_table_name}.{self.dest_field_name}) FROM {self.rel_table_name} WHERE {self.rel_table_name}.{self.dest_join_field} = {self.host_table_name}.id) AS {self.name_postgres}"""
 
-    def to_sql(self):
+    def _set_source(self):
+        """
+        Set the formula's `aggregate` expression, the relation it aggregates over
+        (`group_from`) and the expression of the host id to group by (`group_key`).
+        Formulas aggregate over the related view, or over the related table if they
+        are stored.
+        """
+        rel = self.rel_base_table_name if self.stored else self.rel_view_name
+
+        self.aggregate = f"{self.method}({rel}.{self.dest_field_name})"
+
+        if self.connection_field.relationship_type == "many_to_many":
+            ref = self.reference_table_name
+            self.group_from = f"{rel} JOIN {ref} ON {ref}.{self.rel_base_table_name}_id = {rel}.id"
+
+        else:
+            self.group_from = rel
+
+        if self.join_table_name == self.rel_base_table_name:
+            self.group_key = f"{rel}.{self.join_column}"
+
+        else:
+            self.group_key = f"{self.join_table_name}.{self.join_column}"
+
+    def is_storable(self):
+        """
+        Formulas can be stored as columns when they aggregate over a column of the
+        related table, rather than one which only exists in its view
+        """
+        if not getattr(self, "group_key", None):
+            return False
+
+        if self.dest_field is None:
+            # counts
+            return True
+
+        if isinstance(self.dest_field, FormulaField):
+            return self.dest_field.stored
+
+        return self.dest_field in self.dest_field.table.column_fields()
+
+    def store(self):
+        """
+        Store the formula as a column of its table, aggregated over the related
+        table rather than its view. The column is kept up to date by triggers. See
+        `StoredFormulas`.
+        """
+        self.stored = True
+
+        # formulas are never required
+        self.constraints = None
+
+        if self.method == "COUNT":
+            self.default = 0
+
+        self._set_source()
+
+    def to_sql(self, constraints=True):
+        if self.stored:
+            # `sql` remains the formula's select statement
+            return self.column_sql(constraints=constraints)
+
         return self.sql
@@ -0,0 +1,28 @@
+from knackpostgres.fields._field import Field
+
+
+class GeneratedField(Field):
+    """
+    A subfield of a JSONB field, e.g. the latitude of an address, stored as a
+    generated column so that it can be indexed. See `GENERATED_SUBFIELDS`.
+    """
+
+    def __init__(self, source_field, subfield, table):
+        self.source_field = source_field
+        self.key = subfield["key"]
+
+        name = f"{source_field.name_postgres}_{self.key}"
+
+        super().__init__({"name": name, "data_type": subfield["data_type"]}, name, table)
+
+    def expression(self):
+        # knack stores missing subfields as empty strings
+        value = f"NULLIF({self.source_field.name_postgres} ->> '{self.key}', '')"
+
+        if self.data_type == "TEXT":
+            return value
+
+        return f"{value}::{self.data_type}"
+
+    def column_sql(self, constraints=True):
+        return f"{self.name_postgres} {self.data_type} GENERATED ALWAYS AS ({self.expression()}) STORED"
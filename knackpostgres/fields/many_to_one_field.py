@@ -1,3 +1,4 @@
+from .child_connection_field import ChildConnectionField
 from .connection_field import ConnField
 from knackpostgres.config.constants import FIELD_DEFINITIONS
 
@@ -8,9 +9,13 @@ class ManyToOneField(ConnField):
     def __init__(self, data, name, table):
         super().__init__(data, name, table)
 
-    def to_sql(self):
+        # see `normalize`
+        self.normalized = False
+        self.child_field = None
 
-        pk = "PRIMARY KEY" if self.is_primary_key else ""
+    def to_sql(self, constraints=True):
+
+        pk = "PRIMARY KEY" if self.is_primary_key and constraints else ""
 
         default = self._format_default()
 
@@ -47,6 +52,8 @@ class ManyToOneField(ConnField):
         """
         self.rel_table_name = rel_table_name
 
+        self.base_name = self.name_postgres
+
         self.name_postgres = f"{self.name_postgres}_rel_{self.rel_table_name}_id"
 
         if self.relationship_type == "many_to_one":
@@ -54,3 +61,18 @@ class ManyToOneField(ConnField):
             self.data_type = f"{self.data_type}[]"
 
         return self
+
+    def normalize(self, rel_table):
+        """
+        Rather than storing a one-to-many connection as an array of related ids on
+        the parent ("host") table, store the parent's id in a scalar column of the
+        child table, which can be indexed and joined. The connection field is no
+        longer a column of the host table.
+        """
+        self.normalized = True
+
+        self.child_field = ChildConnectionField(self, rel_table)
+
+        rel_table.fields.append(self.child_field)
+
+        return self
@@ -1,8 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import csv
+from datetime import timedelta
+import io
 import logging
 import sys
 
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from knackpostgres.exceptions.exceptions import ValidationError
+from knackpostgres.fields.child_connection_field import ChildConnectionField
+from knackpostgres.fields.concatenation_field import ConcatenationField
+from knackpostgres.fields.formula_field import FormulaField
+from knackpostgres.fields.generated_field import GeneratedField
+from knackpostgres.fields.many_to_many_field import ManyToManyField
+from knackpostgres.fields.many_to_one_field import ManyToOneField
+from knackpostgres.migration import catalog_type, normalize_type
+from knackpostgres.translator import StreamingKnackTranslator
+from knackpostgres.utils.copy_encoder import encode_row, get_encoder
+from knackpostgres.utils.knack_api import ROWS_PER_PAGE, get_record_pages
+from knackpostgres.utils.ledger import LoadLedger
+from knackpostgres.utils.pipeline import Pipeline
+from knackpostgres.utils.sync_state import SyncState
+from knackpostgres.utils.type_profiler import TypeProfiler, narrower_types
+from knackpostgres.utils.utils import chunks, truncate_pg_name
+
+
+# number of records sent in each `COPY` command
+COPY_BATCH_SIZE = 5000
+
+# number of statements executed in each transaction by `Loader.execute_batch`
+EXECUTE_BATCH_SIZE = 500
+
+# table (in the metadata schema) into which connection records are copied before
+# being resolved
+STAGING_TABLE = "_connections_staging"
+
+STAGING_COLUMNS = [
+    "host_table_name",
+    "field_name",
+    "knack_id",
+    "conn_record_id",
+    "rel_table_name",
+    "reference_table_name",
+]
+
+# fields which are not populated from record data. formulae live in views,
+# and connections are populated after all records have been loaded
+NON_COPY_FIELD_TYPES = [
+    ChildConnectionField,
+    ConcatenationField,
+    FormulaField,
+    GeneratedField,
+    ManyToManyField,
+    ManyToOneField,
+]
+
+
+class BatchResult:
+    """ Outcome of `Loader.execute_batch` """
+
+    def __repr__(self):
+        return f"<BatchResult succeeded={self.succeeded} failed={self.failed}>"
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+
+        # (sql, error message) of each failed statement
+        self.errors = []
 
 
 class Loader:
@@ -20,6 +87,37 @@ class Loader:
         # connection sql must be provided by Translator class (see README)
         self.connections_sql = []
 
+        # connection records must be provided by Translator class (see README)
+        self.connection_data = []
+
+        self.staging_table = f"{self.app.metadata_schema}.{STAGING_TABLE}"
+
+        # true once the connection staging table has been prepared by this loader
+        self._staging = False
+
+        # if true, keep connection records staged by a previous, failed `load_app`
+        self._resume = False
+
+        # progress of `load_app`. see `LoadLedger`
+        self.ledger = LoadLedger(self.app.metadata_schema)
+
+        # high-water marks of `sync`. see `SyncState`
+        self.sync_state = SyncState(self.app.metadata_schema)
+
+        # a StreamingKnackTranslator per table, used by `load_app`
+        self._translators = {}
+
+        # a TypeProfiler per table, used by `load_app` if the app narrows types.
+        # tables which were partially loaded before a resume can't be profiled
+        self._profilers = {}
+        self._unprofiled = set()
+
+        # field: default data type, of each field whose column has been narrowed
+        self._default_types = {}
+
+        # true while statements are grouped by `_transaction`
+        self._in_transaction = False
+
     def connect(
         self,
         host="localhost",
@@ -33,11 +131,21 @@ class Loader:
 
         self.dbname = dbname
 
-        self.conn = psycopg2.connect(
-            host=host, dbname=dbname, user=user, password=password, port=port
-        )
+        # retained so that additional connections can be pooled for parallel loading
+        self.connection_params = {
+            "host": host,
+            "dbname": dbname,
+            "user": user,
+            "password": password,
+            "port": port,
+        }
+
+        self.conn = psycopg2.connect(**self.connection_params)
         self.conn.autocommit = True
         self._confirm_overwrite()
+
+        # narrowed column types are only known to the database
+        self.apply_deployed_types()
         return None
 
     def _confirm_overwrite(self):
@@ -65,60 +173,1010 @@ class Loader:
         self.execute(
             f"ALTER DATABASE {self.dbname} SET search_path TO {self.app.schema},'public';"
         )
+        # `ALTER DATABASE` only applies to new sessions, so set the current one too
+        self.execute(f"SET search_path TO {self.app.schema},'public';")
 
-    def create_tables(self):
+    def create_tables(self, defer_constraints=False):
+        """
+        Create metadata and app tables. With `defer_constraints`, bare tables are
+        created without primary keys, constraints or indexes, so that records can be
+        loaded without maintaining them. In that case, call `create_knack_id_indexes`
+        once records are loaded, and `create_indexes` and `create_constraints` once
+        connections have been resolved.
+        """
+        self._create_tables(defer_constraints)
+
+        if not defer_constraints:
+            self.create_indexes()
+
+    def _create_tables(self, defer_constraints):
         for table in self.app.metadata:
-            self.execute(table.sql)
+            self.execute(table.to_sql(constraints=not defer_constraints))
 
         for table in self.app.tables:
-            self.execute(table.sql)
+            self.execute(table.to_sql(constraints=not defer_constraints))
 
-    def _sequence_views(self):
+    def drop_tables(self):
         """
-        Some views depend on fields in other views. We sort
-        the views to ensure that each view is created after
-        its dependencies.
+        Drop the metadata and app tables, along with the views, indexes and
+        triggers which depend on them
+        """
+        with self._transaction() as cursor:
+            for table in self.app.metadata:
+                cursor.execute(
+                    f"DROP TABLE IF EXISTS {table.schema}.{table.name_postgres} CASCADE;"
+                )
+
+            for table in self.app.tables:
+                cursor.execute(f"DROP TABLE IF EXISTS {table.name_postgres} CASCADE;")
 
-        TODO: what about co-dependent views? yikes.
+    def create_knack_id_indexes(self):
+        """ Build the deferred `knack_id` unique indexes, which connection resolution relies on """
+        for table in self.app.tables:
+            self.execute(table.knack_id_index_sql())
+
+    def create_indexes(self):
+        """ Build the app's indexes on connection and reference columns """
+        for index in self.app.indexes():
+            self.execute(index.to_sql())
+
+    def create_constraints(self):
+        """ Add the deferred primary keys and field constraints to all tables """
+        for table in self.app.metadata + self.app.tables:
+            self.execute(table.constraints_sql())
+
+    def analyze(self):
+        """ Collect planner statistics for all loaded tables """
+        for table in self.app.metadata:
+            self.execute(f"ANALYZE {table.schema}.{table.name_postgres};")
+
+        for table in self.app.tables:
+            self.execute(f"ANALYZE {table.name_postgres};")
+
+    def narrow_types(self, profilers):
         """
-        sequenced_view_names = []
+        Alter columns to the narrower types found by `TypeProfiler`s of the tables'
+        records, and record the new types in the `_fields` metadata table. Views
+        depend on column types, so this must be done before they are created.
+        """
+        fields_table = f"{self.app.metadata_schema}._fields"
 
-        # first, we generate a list of view names in order
-        # using the `depends_on` attribute of each view
-        for i, view in enumerate(self.app.views):
-            if view.name in sequenced_view_names:
-                continue
+        narrowed = {}
 
-            if not view.depends_on:
-                sequenced_view_names.insert(0, view.name)
+        for profiler in profilers:
+            table_name = profiler.table.name_postgres
+
+            types = profiler.narrowed_types()
+
+            if not types:
                 continue
 
-            for dependency_view in view.depends_on:
-                if dependency_view in sequenced_view_names:
-                    continue
-                sequenced_view_names.append(dependency_view)
+            # a single statement, so that the table is only rewritten once
+            alterations = ", ".join(
+                f"ALTER COLUMN {field.name_postgres} TYPE {data_type} USING {self._cast(field, data_type)}"
+                for field, data_type in types.items()
+            )
+
+            self.execute(f"ALTER TABLE {table_name} {alterations};")
+
+            for field, data_type in types.items():
+                self._set_type(field, data_type)
+
+                self.execute(
+                    f"""UPDATE {fields_table} SET data_type = '{data_type}'
+                    WHERE table_name = '{table_name}' AND name = '{field.name_postgres}';"""
+                )
+
+            narrowed[table_name] = {
+                field.name_postgres: data_type for field, data_type in types.items()
+            }
+
+        return narrowed
+
+    def apply_deployed_types(self, deployed=None):
+        """
+        Adopt the column types narrowed by a previous `load_app`, so that migrations
+        keep them and records are encoded for them. Only narrowings which the fields
+        still allow are adopted; others are left for `migrate` to change back.
+        Returns a dict of table name: {column name: data type}.
+        """
+        if not self.app.narrow_types:
+            return {}
+
+        if deployed is None:
+            deployed = self.deployed_schema()
+
+        applied = {}
+
+        for table in self.app.tables:
+            columns = deployed["tables"].get(table.name_postgres, {})
+
+            for field in table.column_fields():
+                for data_type in narrower_types(field):
+                    if field.data_type == data_type:
+                        # e.g. reference table keys, which are always narrowed
+                        break
+
+                    if normalize_type(data_type) == columns.get(field.name_postgres):
+                        self._set_type(field, data_type)
+                        applied.setdefault(table.name_postgres, {})[
+                            field.name_postgres
+                        ] = data_type
+
+        return applied
+
+    def _set_type(self, field, data_type):
+        self._default_types.setdefault(field, field.data_type)
+        field.data_type = data_type
+
+    def _reset_types(self):
+        """ Restore the default types of narrowed fields, e.g. before reloading """
+        for field, data_type in self._default_types.items():
+            field.data_type = data_type
+
+        self._default_types = {}
+
+    def _cast(self, field, data_type):
+        if data_type == "DATE":
+            # dates are profiled at midnight utc, regardless of the session time zone
+            return f"({field.name_postgres} AT TIME ZONE 'UTC')::DATE"
 
-            sequenced_view_names.append(view.name)
+        return f"{field.name_postgres}::{data_type}"
 
-        # now we re-order the actual view classes in the app
-        sequenced_views = []
-        for view_name in sequenced_view_names:
-            for view in self.app.views:
-                if view.name == view_name:
-                    sequenced_views.append(view)
+    def _profiled(self):
+        """ Profilers of the tables whose records were all translated by this `load_app` """
+        for table_name in self._unprofiled:
+            logging.warning(f"{table_name} was resumed and its column types are unchanged")
+
+        return [
+            profiler
+            for table_name, profiler in self._profilers.items()
+            if table_name not in self._unprofiled
+        ]
+
+    def store_formulas(self):
+        """
+        Compute the app's stored formula columns, then create the triggers which
+        keep them up to date. The triggers are created last, so that neither loading
+        nor the backfill fire them.
+        """
+        for sql in self._stored_formula_sql():
+            self.execute(sql)
+
+    def _stored_formula_sql(self):
+        levels = self.app.stored_formula_levels()
+
+        # formulas of formulas are backfilled after the formulas they aggregate
+        formulas = [stored for level in levels for stored in level]
+
+        backfill = [sql for stored in formulas for sql in stored.backfill_sql()]
+
+        triggers = [sql for stored in formulas for sql in stored.trigger_sql()]
+
+        return backfill + triggers
+
+    def create_views(self, workers=1):
+        """
+        Create views in dependency order. With `workers` > 1, the views of each
+        dependency level are created concurrently over pooled connections, one level
+        at a time.
+        """
+        levels = self.app.view_levels()
+
+        self.app.views = [view for level in levels for view in level]
+
+        self._execute_levels([[view.sql for view in level] for level in levels], workers)
+
+    def refresh_views(self, tables=None, concurrently=True, workers=1):
+        """
+        Refresh materialized views in dependency order, so that each view is
+        refreshed after the views it selects from.
+
+        Optionally pass a list of `tables` (postgres table names) whose data has
+        changed. Only the views which read those tables are refreshed, along with
+        any views which select from them.
+
+        Concurrent refreshes do not lock out readers. See `create_views` regarding
+        `workers`.
+        """
+        levels = self.app.view_levels()
 
-        return sequenced_views
+        if tables is None:
+            stale = {view.name for level in levels for view in level}
 
-    def create_views(self):
-        self.app.views = self._sequence_views()
+        else:
+            tables = set(tables)
+            stale = set()
 
-        for view in self.app.views:
-            self.execute(view.sql)
+            # levels are in dependency order, so a view's dependencies are marked
+            # before the view itself is visited
+            for level in levels:
+                for view in level:
+                    reads_changed_table = tables.intersection(view.depends_on_tables)
+
+                    if reads_changed_table or stale.intersection(view.depends_on):
+                        stale.add(view.name)
+
+        levels = [
+            [view for view in level if view.materialized and view.name in stale]
+            for level in levels
+        ]
+
+        levels = [level for level in levels if level]
+
+        sql = [
+            [view.refresh_sql(concurrently=concurrently) for view in level]
+            for level in levels
+        ]
+
+        self._execute_levels(sql, workers)
+
+        # return the names of the refreshed views
+        return [view.name for level in levels for view in level]
+
+    def _execute_levels(self, levels, workers):
+        """
+        Execute lists of statements one after another. The statements within each
+        list are independent, and with `workers` > 1 are executed concurrently over
+        pooled connections.
+        """
+        if workers <= 1:
+            for level in levels:
+                for sql in level:
+                    self.execute(sql)
+            return
+
+        pool = self._connection_pool(workers)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for level in levels:
+                    futures = [
+                        executor.submit(self._execute_pooled, pool, sql) for sql in level
+                    ]
+
+                    # the next level may select from any view in this one
+                    for future in futures:
+                        future.result()
+
+        finally:
+            pool.closeall()
+
+    def _execute_pooled(self, pool, sql):
+        conn = pool.getconn()
+
+        try:
+            conn.autocommit = True
+
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+
+        finally:
+            pool.putconn(conn)
+
+    def deployed_schema(self):
+        """
+        Read the tables and views deployed to the app's schema from the catalog.
+        Returns a dict with "tables" and "views" keys, each a dict of name: {column name:
+        normalized data type}. Materialized views are included in "views", and their
+        names are also listed in "materialized".
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name FROM information_schema.views WHERE table_schema = %s;",
+                (self.app.schema,),
+            )
+
+            view_names = {row[0] for row in cursor.fetchall()}
+
+            cursor.execute(
+                """SELECT table_name, column_name, data_type, udt_name
+                FROM information_schema.columns WHERE table_schema = %s
+                ORDER BY table_name, ordinal_position;""",
+                (self.app.schema,),
+            )
+
+            columns = cursor.fetchall()
+
+            # materialized views are missing from information_schema
+            cursor.execute(
+                """SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_attribute a ON a.attrelid = c.oid
+                WHERE n.nspname = %s AND c.relkind = 'm'
+                AND a.attnum > 0 AND NOT a.attisdropped
+                ORDER BY c.relname, a.attnum;""",
+                (self.app.schema,),
+            )
+
+            materialized_columns = cursor.fetchall()
+
+        deployed = {"tables": {}, "views": {}, "materialized": set()}
+
+        for view_name, column_name, data_type in materialized_columns:
+            deployed["materialized"].add(view_name)
+            deployed["views"].setdefault(view_name, {})[column_name] = normalize_type(
+                data_type
+            )
+
+        for table_name, column_name, data_type, udt_name in columns:
+            kind = "views" if table_name in view_names else "tables"
+            deployed[kind].setdefault(table_name, {})[column_name] = catalog_type(
+                data_type, udt_name
+            )
+
+        return deployed
+
+    def migrate(self, drop_columns=True):
+        """
+        Migrate the deployed schema to match the app in a single transaction, rather
+        than dropping and reloading everything. New tables and columns will be empty
+        until they are loaded. Metadata tables are refreshed. Returns the statements
+        which were executed.
+        """
+        self.create_schema()
+
+        deployed = self.deployed_schema()
+
+        self.apply_deployed_types(deployed)
+
+        statements = self.app.migration_sql(deployed, drop_columns=drop_columns)
+
+        if self.app.stored_formulas:
+            # new stored formulas must be computed, and their triggers replaced
+            statements += self._stored_formula_sql()
+
+        with self._transaction() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+            for table in self.app.metadata:
+                cursor.execute(table.to_sql())
+                cursor.execute(f"TRUNCATE {table.schema}.{table.name_postgres};")
+                self._copy(cursor, table, table.rows, COPY_BATCH_SIZE)
+
+        return statements
 
     def update_connections(self):
         for sql in self.connections_sql:
             self.execute(sql)
 
+    def copy_records(self, table, records, batch_size=COPY_BATCH_SIZE):
+        """
+        Bulk load records into `table` with `COPY ... FROM STDIN`. `records` is any
+        iterable of dicts keyed by postgres fieldname, e.g. `KnackTranslator.data` or
+        `MetaTable.rows`. Records are streamed to the database in batches of
+        `batch_size`. Returns the number of records copied.
+        """
+        with self.conn.cursor() as cursor:
+            return self._copy(cursor, table, records, batch_size)
+
+    def load_app(self, api_key, queue_size=2, defer_constraints=True, resume=False):
+        """
+        Create and load the entire app. Records are fetched from Knack a page at a
+        time, translated and written to the database by three concurrent stages
+        joined by queues of `queue_size` pages, so one page can be fetched while
+        another is translated and a third is written. Memory use is bounded by the
+        number of pages in flight, not the size of the app.
+
+        Then connections are resolved, stored formulas are computed and views are
+        created. Returns a dict of stage name: `StageStats` for the "fetch",
+        "translate" and "write" stages.
+
+        Progress is recorded in the metadata schema as each page and phase is
+        committed. If a load fails, call again with `resume=True` to skip completed
+        tables, pages and phases. Otherwise, the tables of a previous load are
+        dropped and loaded from scratch.
+        """
+        self._resume = resume
+
+        self.create_schema()
+
+        self.execute(self.ledger.create_sql())
+
+        with self.conn.cursor() as cursor:
+            self.ledger.read(cursor)
+
+        if not resume and self.ledger.completed:
+            # tables are created `IF NOT EXISTS`, so the records of a previous load
+            # would be loaded again on top of themselves
+            self.drop_tables()
+            self.execute(self.ledger.reset_sql())
+            self.ledger.completed = set()
+
+            # the records will be profiled again
+            self._reset_types()
+
+        self.create_tables(defer_constraints=defer_constraints)
+
+        self._run_phase("metadata", self._load_metadata)
+
+        pipeline = Pipeline(
+            [
+                (
+                    "fetch",
+                    lambda table: self._fetch(table, api_key),
+                    lambda result: len(result[2] or []),
+                ),
+                ("translate", self._translate, lambda result: len(result[2] or [])),
+                ("write", self._write, lambda count: count),
+            ],
+            queue_size=queue_size,
+        )
+
+        # reference tables have no records of their own
+        stats = pipeline.run(
+            [
+                table
+                for table in self.app.tables
+                if not table.associative
+                and not self.ledger.is_complete("records", table.name_postgres)
+            ]
+        )
+
+        if self.app.narrow_types:
+            # columns are retyped before they are indexed
+            self._run_phase("types", lambda: self.narrow_types(self._profiled()))
+
+        if defer_constraints:
+            self._run_phase("knack_id_indexes", self.create_knack_id_indexes)
+
+        self._run_phase("connections", self.resolve_connections)
+
+        if defer_constraints:
+            self._run_phase("indexes", self.create_indexes)
+            self._run_phase("constraints", self.create_constraints)
+
+        if self.app.stored_formulas:
+            self._run_phase("formulas", self.store_formulas)
+
+        self.analyze()
+
+        self._run_phase("views", self.create_views)
+
+        return stats
+
+    def _run_phase(self, phase, func):
+        """ Run a `load_app` phase in a transaction, unless it has already completed """
+        if self.ledger.is_complete(phase):
+            return None
+
+        try:
+            with self._transaction() as cursor:
+                func()
+                self.ledger.record(cursor, phase)
+
+        except Exception:
+            logging.error(f"The {phase} phase of the load failed and was rolled back")
+            raise
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Group statements into a single transaction on our autocommit connection.
+        Statements executed with any of the connection's cursors are included, and
+        `execute` raises rather than logs their errors, since the transaction is
+        aborted by them.
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute("BEGIN;")
+            self._in_transaction = True
+
+            try:
+                yield cursor
+
+            except Exception:
+                cursor.execute("ROLLBACK;")
+                raise
+
+            finally:
+                self._in_transaction = False
+
+            cursor.execute("COMMIT;")
+
+    def _load_metadata(self):
+        for table in self.app.metadata:
+            self.copy_records(table, table.rows)
+
+    def _fetch(self, table, api_key):
+        """ Yields (table, page number, records) for each page not yet loaded """
+        loaded = self.ledger.completed_batches("records", table.name_postgres)
+
+        if loaded:
+            # records loaded before a resume won't be seen by the profiler
+            self._unprofiled.add(table.name_postgres)
+
+        start_page = 1
+
+        while start_page in loaded:
+            start_page += 1
+
+        for page, records in get_record_pages(
+            self.app.app_id, api_key, table.key_knack, start_page=start_page
+        ):
+            if page in loaded:
+                continue
+
+            yield table, page, records
+
+        # signals that all of the table's records have been fetched
+        yield table, None, None
+
+    def _translate(self, fetched):
+        table, page, records = fetched
+
+        if page is None:
+            return table, page, None, None
+
+        if table.name_postgres not in self._translators:
+            self._translators[table.name_postgres] = StreamingKnackTranslator(table)
+
+        rows, connection_data = self._translators[table.name_postgres].translate_batch(
+            records
+        )
+
+        if self.app.narrow_types:
+            if table.name_postgres not in self._profilers:
+                self._profilers[table.name_postgres] = TypeProfiler(table)
+
+            self._profilers[table.name_postgres].update(rows)
+
+        return table, page, rows, connection_data
+
+    def _write(self, translated):
+        """
+        Copy a page of records and stage its connections in the same transaction
+        as its ledger entry.
+        """
+        table, page, rows, connection_data = translated
+
+        with self._transaction() as cursor:
+            if page is None:
+                self.ledger.record(cursor, "records", table.name_postgres)
+                return 0
+
+            self._stage_connections(cursor, connection_data)
+            count = self._copy(cursor, table, rows, COPY_BATCH_SIZE)
+            self.ledger.record(cursor, "records", table.name_postgres, batch=page)
+
+        return count
+
+    def sync(self, api_key, modified_fields, rows_per_page=ROWS_PER_PAGE):
+        """
+        Incrementally sync records which have changed since the last sync, rather
+        than reloading everything. `modified_fields` is a dict of knack object key:
+        the key of the object's "modified date" field.
+
+        Only the records modified since each table's high-water mark are fetched.
+        Knack date filters compare whole days, so records from the day before the
+        high-water mark are fetched again. The records are upserted on `knack_id`,
+        their connections are cleared and resolved again, and the new high-water
+        marks are recorded in the `_sync_state` metadata table, all in a single
+        transaction. Tables which have not been synced before are fetched in full.
+        Materialized views of the synced tables are refreshed afterwards.
+
+        Returns a dict of table name: number of records upserted.
+        """
+        tables = [
+            (self._sync_table(obj, field_key), field_key)
+            for obj, field_key in modified_fields.items()
+        ]
+
+        self.execute(self.sync_state.create_sql())
+
+        counts = {}
+
+        synced = {}
+
+        with self._transaction() as cursor:
+            for table, field_key in tables:
+                high_water_mark = self.sync_state.read(
+                    cursor, table.name_postgres, field_key
+                )
+
+                filters = None
+
+                if high_water_mark:
+                    since = (high_water_mark - timedelta(days=1)).strftime("%m/%d/%Y")
+                    filters = [
+                        {"field": field_key, "operator": "is after", "value": since}
+                    ]
+
+                pages = get_record_pages(
+                    self.app.app_id,
+                    api_key,
+                    table.key_knack,
+                    rows_per_page=rows_per_page,
+                    filters=filters,
+                )
+
+                temp_table, count = self._upsert(cursor, table, pages)
+
+                synced[table.name_postgres] = temp_table
+                counts[table.name_postgres] = count
+
+            # tables whose data may have changed, including reference and child
+            # tables whose connections were cleared
+            changed = set(synced)
+
+            for table, field_key in tables:
+                changed |= self._clear_connections(
+                    cursor, table, synced[table.name_postgres]
+                )
+
+            self.resolve_connections()
+
+            for table, field_key in tables:
+                column = self.app.find_field_from_field_key(
+                    field_key, return_attr="name_postgres"
+                )
+                cursor.execute(f"SELECT max({column}) FROM {table.name_postgres};")
+
+                self.sync_state.record(
+                    cursor, table.name_postgres, field_key, cursor.fetchone()[0]
+                )
+
+        if self.app.materialized_views:
+            self.refresh_views(tables=changed)
+
+        return counts
+
+    def _sync_table(self, obj, field_key):
+        table = self.app.find_table_from_object_key(obj)
+
+        if not table:
+            raise ValidationError(f"Object {obj} is not in the app")
+
+        if self.app.find_table_from_field_key(field_key) is not table:
+            raise ValidationError(
+                f"Modified date field {field_key} is not a field of {table.name_postgres}"
+            )
+
+        if self.app.find_field_from_field_key(field_key, return_attr="type_knack") != "date_time":
+            raise ValidationError(
+                f"Modified date field {field_key} of {table.name_postgres} is not a date field"
+            )
+
+        return table
+
+    def _upsert(self, cursor, table, pages):
+        """
+        Translate pages of records into a temporary table and upsert them. Returns
+        the name of the temporary table, which lives until the transaction ends, and
+        the number of records.
+        """
+        fields = self._copy_fields(table)
+        columns = [field.name_postgres for field in fields]
+        columns_sql = ", ".join(columns)
+
+        temp_table = truncate_pg_name(f"_sync_{table.name_postgres}")
+
+        # column types only. the table's constraints and defaults are left behind
+        cursor.execute(
+            f"""CREATE TEMPORARY TABLE {temp_table} ON COMMIT DROP AS
+            SELECT {columns_sql} FROM {table.name_postgres} WITH NO DATA;"""
+        )
+
+        # numbers the rows in the order they were fetched
+        cursor.execute(f"ALTER TABLE {temp_table} ADD COLUMN _seq BIGSERIAL;")
+
+        if table.name_postgres not in self._translators:
+            self._translators[table.name_postgres] = StreamingKnackTranslator(table)
+
+        translator = self._translators[table.name_postgres]
+
+        for page, records in pages:
+            rows, connection_data = translator.translate_batch(records)
+
+            self._stage_connections(cursor, connection_data)
+
+            self._copy_rows(
+                cursor,
+                temp_table,
+                columns,
+                [field.data_type for field in fields],
+                rows,
+                COPY_BATCH_SIZE,
+            )
+
+        updates = ", ".join(
+            f"{column} = EXCLUDED.{column}" for column in columns if column != "knack_id"
+        )
+
+        # a record modified while we paged through may have been fetched twice, in
+        # which case its last fetched copy is the latest
+        cursor.execute(
+            f"""INSERT INTO {table.name_postgres} ({columns_sql})
+            SELECT DISTINCT ON (knack_id) {columns_sql} FROM {temp_table}
+            ORDER BY knack_id, _seq DESC
+            ON CONFLICT (knack_id) DO UPDATE SET {updates};"""
+        )
+
+        return temp_table, cursor.rowcount
+
+    def _clear_connections(self, cursor, table, temp_table):
+        """
+        Clear the connections of the synced records in `temp_table`, so that they can
+        be resolved again from their staged connection records. Returns the names of
+        the tables which were modified.
+        """
+        modified = set()
+
+        synced_knack_ids = f"SELECT knack_id FROM {temp_table}"
+
+        synced_ids = (
+            f"SELECT id FROM {table.name_postgres} WHERE knack_id IN ({synced_knack_ids})"
+        )
+
+        for field in table.fields:
+            if isinstance(field, ManyToManyField):
+                cursor.execute(
+                    f"""DELETE FROM {field.reference_table_name}
+                    WHERE {table.name_postgres}_id IN ({synced_ids});"""
+                )
+                modified.add(field.reference_table_name)
+
+            elif isinstance(field, ManyToOneField) and field.normalized:
+                child = field.child_field
+                cursor.execute(
+                    f"""UPDATE {child.table.name_postgres} SET {child.name_postgres} = NULL
+                    WHERE {child.name_postgres} IN ({synced_ids});"""
+                )
+                modified.add(child.table.name_postgres)
+
+            elif isinstance(field, ManyToOneField):
+                cursor.execute(
+                    f"""UPDATE {table.name_postgres} SET {field.name_postgres} = NULL
+                    WHERE knack_id IN ({synced_knack_ids});"""
+                )
+
+        return modified
+
+    def load_tables(self, table_data, workers=4, defer_constraints=False):
+        """
+        Create and fill tables concurrently. `table_data` is a list of
+        `(table, records)` tuples. The metadata tables and all of the app's tables,
+        including many-to-many reference tables, are created first (if they don't
+        exist), since connections will be resolved into them. Then each table's
+        records are copied on a pooled connection by one of `workers` threads.
+        Tables are scheduled largest first, so that the biggest object does not
+        start last.
+
+        Returns once every table has been loaded, so connections and views can safely
+        be handled afterwards. Returns a dict of table name: record count.
+
+        See `create_tables` regarding `defer_constraints`.
+        """
+        self._create_tables(defer_constraints)
+
+        table_data = sorted(table_data, key=lambda item: len(item[1]), reverse=True)
+
+        pool = self._connection_pool(workers)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    (
+                        table,
+                        executor.submit(self._load_table, pool, table, records),
+                    )
+                    for table, records in table_data
+                ]
+
+                # wait for all tables to load. re-raises any worker exceptions
+                counts = {
+                    table.name_postgres: future.result() for table, future in futures
+                }
+
+        finally:
+            pool.closeall()
+
+        if not defer_constraints:
+            self.create_indexes()
+
+        return counts
+
+    def _connection_pool(self, size):
+        return ThreadedConnectionPool(
+            1,
+            size,
+            options=f"-c search_path={self.app.schema},public",
+            **self.connection_params,
+        )
+
+    def _load_table(self, pool, table, records):
+        conn = pool.getconn()
+
+        try:
+            conn.autocommit = True
+
+            with conn.cursor() as cursor:
+                return self._copy(cursor, table, records, COPY_BATCH_SIZE)
+
+        finally:
+            pool.putconn(conn)
+
+    def _copy(self, cursor, table, records, batch_size):
+        fields = self._copy_fields(table)
+
+        return self._copy_rows(
+            cursor,
+            f"{table.schema}.{table.name_postgres}",
+            [field.name_postgres for field in fields],
+            [field.data_type for field in fields],
+            records,
+            batch_size,
+        )
+
+    def _copy_rows(self, cursor, table_name, columns, data_types, records, batch_size):
+        encoders = [get_encoder(data_type) for data_type in data_types]
+
+        sql = f"COPY {table_name} ({', '.join(columns)}) FROM STDIN"
+
+        count = 0
+
+        for batch in chunks(records, batch_size):
+            data = io.StringIO(
+                "".join(encode_row(record, columns, encoders) for record in batch)
+            )
+            cursor.copy_expert(sql, data)
+            count += len(batch)
+
+        return count
+
+    def _copy_fields(self, table):
+        return [
+            field
+            for field in table.fields
+            if not field.is_primary_key and type(field) not in NON_COPY_FIELD_TYPES
+        ]
+
+    def resolve_connections(self):
+        """
+        Populate connection fields in bulk. Connection records, either staged with
+        `stage_connections` or gathered in `connection_data` from each
+        `KnackTranslator.connection_data`, are copied into a staging table.
+        Each many-to-one connection field is then resolved with a single set-based
+        `UPDATE ... FROM ... JOIN`, and each many-to-many reference table is filled
+        with a single `INSERT ... SELECT`.
+        """
+        with self.conn.cursor() as cursor:
+            self._stage_connections(cursor, self.connection_data)
+            self.connection_data = []
+
+            cursor.execute(
+                f"CREATE INDEX ON {self.staging_table} (host_table_name, field_name);"
+            )
+            cursor.execute(f"ANALYZE {self.staging_table};")
+
+            fields = self._staged_fields(cursor)
+
+            for sql in self._many_to_one_sql(fields):
+                cursor.execute(sql)
+
+            for sql in self._many_to_many_sql(fields):
+                cursor.execute(sql)
+
+            cursor.execute(f"DROP TABLE {self.staging_table};")
+            self._staging = False
+
+    def stage_connections(self, connection_data):
+        """
+        Copy connection records into the staging table as they are translated, rather
+        than holding them all in memory until `resolve_connections`.
+        """
+        with self.conn.cursor() as cursor:
+            self._stage_connections(cursor, connection_data)
+
+    def _stage_connections(self, cursor, connection_data):
+        if not self._staging:
+            columns_sql = ", ".join(f"{column} TEXT" for column in STAGING_COLUMNS)
+
+            if not self._resume:
+                cursor.execute(f"DROP TABLE IF EXISTS {self.staging_table};")
+
+            # the staging table is a regular table, rather than a temporary one, so
+            # that staged records survive a failed load
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.staging_table} ({columns_sql});"
+            )
+            self._staging = True
+
+        self._copy_rows(
+            cursor,
+            self.staging_table,
+            STAGING_COLUMNS,
+            ["TEXT" for column in STAGING_COLUMNS],
+            connection_data,
+            COPY_BATCH_SIZE,
+        )
+
+    def _staged_fields(self, cursor):
+        """
+        Unique (host table, field, related table, is many-to-many) combinations in
+        the staging table
+        """
+        cursor.execute(
+            f"""SELECT DISTINCT host_table_name, field_name, rel_table_name,
+            reference_table_name IS NOT NULL FROM {self.staging_table};"""
+        )
+        return cursor.fetchall()
+
+    def _many_to_one_sql(self, fields):
+        statements = []
+
+        for host_table_name, field_name, rel_table_name, many_to_many in fields:
+            if many_to_many:
+                continue
+
+            field = self.app.find_field_from_name(host_table_name, field_name)
+
+            staged = f"""{self.staging_table} AS s
+                JOIN {rel_table_name} AS r ON r.knack_id = s.conn_record_id
+                WHERE s.host_table_name = '{host_table_name}'
+                AND s.field_name = '{field_name}'"""
+
+            if field.normalized:
+                # the host is the parent of a one-to-many connection, and each
+                # child references it
+                statements.append(
+                    f"""UPDATE {rel_table_name} AS r SET {field.child_field.name_postgres} = h.id
+                    FROM {self.staging_table} AS s
+                    JOIN {host_table_name} AS h ON h.knack_id = s.knack_id
+                    WHERE s.host_table_name = '{host_table_name}'
+                    AND s.field_name = '{field_name}'
+                    AND r.knack_id = s.conn_record_id;"""
+                )
+
+            elif field.data_type.endswith("[]"):
+                # the host is the parent of a one-to-many connection, so collect
+                # all related ids into the array column
+                statements.append(
+                    f"""UPDATE {host_table_name} AS h SET {field_name} = agg.ids
+                    FROM (SELECT s.knack_id, array_agg(r.id) AS ids FROM {staged}
+                    GROUP BY s.knack_id) AS agg
+                    WHERE h.knack_id = agg.knack_id;"""
+                )
+            else:
+                statements.append(
+                    f"""UPDATE {host_table_name} AS h SET {field_name} = r.id
+                    FROM {staged}
+                    AND h.knack_id = s.knack_id;"""
+                )
+
+        return statements
+
+    def _many_to_many_sql(self, fields):
+        """
+        Join the staged (host knack_id, related knack_id) pairs to both tables to
+        find their ids. `EXCEPT` drops duplicate pairs, including pairs which already
+        exist in the reference table.
+        """
+        statements = []
+
+        for host_table_name, field_name, rel_table_name, many_to_many in fields:
+            if not many_to_many:
+                continue
+
+            field = self.app.find_field_from_name(host_table_name, field_name)
+            reference_table_name = field.reference_table_name
+
+            host_column = f"{host_table_name}_id"
+            rel_column = f"{rel_table_name}_id"
+
+            statements.append(
+                f"""INSERT INTO {reference_table_name} ({host_column}, {rel_column})
+                SELECT h.id, r.id FROM {self.staging_table} AS s
+                JOIN {host_table_name} AS h ON h.knack_id = s.knack_id
+                JOIN {rel_table_name} AS r ON r.knack_id = s.conn_record_id
+                WHERE s.host_table_name = '{host_table_name}'
+                AND s.field_name = '{field_name}'
+                EXCEPT SELECT {host_column}, {rel_column} FROM {reference_table_name};"""
+            )
+
+        return statements
+
     def execute(self, sql):
         """ executes a singal sql statement or a list of them """
         with self.conn.cursor() as cursor:
@@ -129,8 +1187,76 @@ class Loader:
                 self._execute_many(cursor, sql)
 
             except psycopg2.ProgrammingError as e:
+                if self._in_transaction:
+                    # the rest of the transaction would fail with an unrelated error
+                    raise
+
                 logging.error(e)
-                pass
+
+    def execute_batch(self, sql_list, batch_size=EXECUTE_BATCH_SIZE):
+        """
+        Execute a list of sql statements in transactions of `batch_size` statements.
+        Each batch is sent to the database in a single round trip. If a batch fails,
+        it is rolled back to a savepoint and its statements are retried one at a time,
+        each behind its own savepoint, so that a bad statement is skipped without
+        losing the rest of the batch. Returns a `BatchResult`.
+        """
+        result = BatchResult()
+
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = False
+
+        try:
+            with self.conn.cursor() as cursor:
+                for batch in chunks(sql_list, batch_size):
+                    self._execute_batch(cursor, batch, result)
+                    self.conn.commit()
+
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        finally:
+            self.conn.autocommit = autocommit
+
+        return result
+
+    def _execute_batch(self, cursor, batch, result):
+        cursor.execute("SAVEPOINT batch;")
+
+        try:
+            cursor.execute("\n".join(self._terminate(sql) for sql in batch))
+
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT batch;")
+
+        else:
+            cursor.execute("RELEASE SAVEPOINT batch;")
+            result.succeeded += len(batch)
+            return result
+
+        # something in the batch failed, so isolate the bad statement(s)
+        for sql in batch:
+            cursor.execute("SAVEPOINT statement;")
+
+            try:
+                cursor.execute(sql)
+
+            except psycopg2.Error as e:
+                logging.error(e)
+                cursor.execute("ROLLBACK TO SAVEPOINT statement;")
+                result.failed += 1
+                result.errors.append((sql, str(e)))
+
+            else:
+                cursor.execute("RELEASE SAVEPOINT statement;")
+                result.succeeded += 1
+
+        return result
+
+    def _terminate(self, sql):
+        sql = sql.strip()
+        return sql if sql.endswith(";") else f"{sql};"
 
     def _execute_one(self, cursor, sql):
         return cursor.execute(sql)
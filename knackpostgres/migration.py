@@ -0,0 +1,176 @@
+"""
+Migrate a deployed database schema to match an `App`, without dropping and
+reloading everything.
+"""
+from knackpostgres.config.constants import TAB
+
+# postgres type names and aliases, mapped to the names used by the catalog
+CANONICAL_TYPES = {
+    "serial": "integer",
+    "int": "integer",
+    "int4": "integer",
+    "int2": "smallint",
+    "int8": "bigint",
+    "bigserial": "bigint",
+    "float8": "double precision",
+    "bool": "boolean",
+    "timestamptz": "timestamp with time zone",
+    "timestamp": "timestamp without time zone",
+}
+
+
+def normalize_type(data_type):
+    """ Normalize a postgres data type, e.g. `TEXT[]` -> `text[]`, `SERIAL` -> `integer` """
+    data_type = " ".join(data_type.lower().split())
+
+    is_array = data_type.endswith("[]")
+
+    base_type = data_type.replace("[]", "")
+    base_type = CANONICAL_TYPES.get(base_type, base_type)
+
+    return f"{base_type}[]" if is_array else base_type
+
+
+def catalog_type(data_type, udt_name):
+    """ Normalize a type from `information_schema.columns` """
+    if data_type == "ARRAY":
+        # array udt names are prefixed with an underscore, e.g. `_text`
+        return normalize_type(f"{udt_name[1:]}[]")
+
+    return normalize_type(data_type)
+
+
+class Migration:
+    """
+    Diff an `App`'s generated schema against the deployed schema and generate the
+    statements needed to migrate it.
+
+    `deployed` is a dict with "tables" and "views" keys, each a dict of name: {column
+    name: normalized data type}, as returned by `Loader.deployed_schema`. Its optional
+    "materialized" key lists the deployed views which are materialized.
+
+    New tables are created, and columns are added, dropped or changed. Views which
+    are new, whose columns have changed, which switch between plain and materialized,
+    or which depend on a changed table or view, are dropped before the tables are
+    altered and recreated afterwards. Tables which are deployed but not in the app
+    are left alone.
+    """
+
+    def __repr__(self):
+        return f"<Migration {self.app.name}> ({len(self.sql)} statements)"
+
+    def __init__(self, app, deployed, drop_columns=True):
+        self.app = app
+        self.deployed = deployed
+        self.drop_columns = drop_columns
+
+        self.new_tables = []
+        self.changed_tables = []
+
+        self.table_sql = self._diff_tables()
+        self.changed_views = self._diff_views()
+
+        self.sql = self._to_sql()
+
+    def _diff_tables(self):
+        statements = []
+
+        for table in self.app.tables:
+            name = table.name_postgres
+
+            deployed_columns = self.deployed["tables"].get(name)
+
+            if deployed_columns is None:
+                self.new_tables.append(name)
+                statements.append(table.to_sql())
+                statements += table.index_sql()
+                continue
+
+            table_statements = self._diff_columns(table, deployed_columns)
+
+            if table_statements:
+                self.changed_tables.append(name)
+                # indexes of new columns. existing indexes are skipped
+                statements += table_statements + table.index_sql()
+
+        return statements
+
+    def _diff_columns(self, table, deployed_columns):
+        name = table.name_postgres
+
+        columns = {field.name_postgres: field for field in table.column_fields()}
+
+        statements = []
+
+        for column_name, field in columns.items():
+            if column_name not in deployed_columns:
+                # new columns are added without constraints, because they will be empty
+                statements.append(
+                    f"ALTER TABLE {name} ADD COLUMN {field.to_sql(constraints=False)};"
+                )
+
+            elif normalize_type(field.data_type) != deployed_columns[column_name]:
+                statements.append(
+                    f"ALTER TABLE {name} ALTER COLUMN {column_name} TYPE {field.data_type} USING {column_name}::{field.data_type};"
+                )
+
+        if self.drop_columns:
+            for column_name in deployed_columns:
+                if column_name not in columns:
+                    statements.append(f"ALTER TABLE {name} DROP COLUMN {column_name};")
+
+        return statements
+
+    def _view_columns(self, view):
+        return {field.name_postgres for field in view.table.column_fields()} | {
+            field.name_postgres for field in view.formula_fields + view.concat_fields
+        }
+
+    def _diff_views(self):
+        changed_tables = set(self.changed_tables + self.new_tables)
+
+        changed = set()
+
+        for view in self.app.views:
+            deployed_columns = self.deployed["views"].get(view.name)
+
+            if (
+                deployed_columns is None
+                or set(deployed_columns) != self._view_columns(view)
+                or changed_tables.intersection(view.depends_on_tables)
+                or view.materialized != self._is_materialized(view.name)
+            ):
+                changed.add(view.name)
+
+        # views which select from changed views must be recreated as well
+        while True:
+            dependents = {
+                view.name
+                for view in self.app.views
+                if view.name not in changed and changed.intersection(view.depends_on)
+            }
+
+            if not dependents:
+                break
+
+            changed |= dependents
+
+        return [view for view in self.app.sequence_views() if view.name in changed]
+
+    def _is_materialized(self, view_name):
+        return view_name in self.deployed.get("materialized", ())
+
+    def _deployed_kind(self, view_name):
+        return "MATERIALIZED VIEW" if self._is_materialized(view_name) else "VIEW"
+
+    def _to_sql(self):
+        # views must be dropped before the columns they select can be altered
+        drop_views = [
+            f"DROP {self._deployed_kind(view.name)} IF EXISTS {view.name} CASCADE;"
+            for view in reversed(self.changed_views)
+            if view.name in self.deployed["views"]
+        ]
+
+        create_views = [view.sql for view in self.changed_views]
+
+        return drop_views + self.table_sql + create_views
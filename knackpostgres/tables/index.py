@@ -0,0 +1,25 @@
+from knackpostgres.utils.utils import truncate_pg_name
+
+
+class Index:
+    """
+    A (non-unique) index on a table's columns. Unique indexes are created by the
+    `UNIQUE` constraints of their fields.
+    """
+
+    def __repr__(self):
+        return f"<Index {self.name}>"
+
+    def __init__(self, table_name, columns, method="btree", reason=None):
+        self.table_name = table_name
+        self.columns = columns
+        self.method = method
+
+        # why the index exists, recorded in the `_indexes` metadata table
+        self.reason = reason
+
+        self.name = truncate_pg_name(f"{table_name}_{'_'.join(columns)}_idx")
+
+    def to_sql(self):
+        columns = ", ".join(self.columns)
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table_name} USING {self.method} ({columns});"
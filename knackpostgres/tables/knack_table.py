@@ -1,12 +1,15 @@
 from knackpostgres.tables._table import Table
 from knackpostgres.fields._knack_field import KnackField
+from knackpostgres.fields.child_connection_field import ChildConnectionField
 from knackpostgres.fields.concatenation_field import ConcatenationField
 from knackpostgres.fields.formula_field import FormulaField
+from knackpostgres.fields.generated_field import GeneratedField
 from knackpostgres.fields.many_to_one_field import ManyToOneField
 from knackpostgres.fields.many_to_many_field import ManyToManyField
 from knackpostgres.fields.standard_field import StandardField
-from knackpostgres.utils.utils import valid_pg_name
-from knackpostgres.config.constants import FIELD_DEFINITIONS, TAB
+from knackpostgres.tables.index import Index
+from knackpostgres.utils.utils import truncate_pg_name, valid_pg_name
+from knackpostgres.config.constants import FIELD_DEFINITIONS, GENERATED_SUBFIELDS, TAB
 
 
 class KnackTable(Table):
@@ -16,6 +19,8 @@ class KnackTable(Table):
         # where data is knack "objects" list from app data
         super().__init__(data, name, schema)
 
+        self.associative = associative
+
         for key in data:
             setattr(self, key + "_knack", data[key])
 
@@ -44,6 +49,40 @@ class KnackTable(Table):
 
         return self
 
+    def add_generated_fields(self):
+        """
+        Add generated columns for the commonly queried subfields of address and
+        name fields. See `GENERATED_SUBFIELDS`
+        """
+        for field in list(self.fields):
+            config = GENERATED_SUBFIELDS.get(getattr(field, "type_knack", None))
+
+            if not config or not isinstance(field, StandardField):
+                continue
+
+            field.generated_fields = {
+                subfield["key"]: GeneratedField(field, subfield, self)
+                for subfield in config["columns"]
+            }
+
+            self.fields += field.generated_fields.values()
+
+        return self
+
+    def prune_connections(self, obj_lookup):
+        """
+        Remove connection fields which reference objects that are not in `obj_lookup`,
+        i.e., objects excluded by the App's `obj_filter`
+        """
+        self.fields = [
+            field
+            for field in self.fields
+            if not hasattr(field, "relationship_type")
+            or field.relationship_knack["object"] in obj_lookup
+        ]
+
+        return self
+
     def _remove_dupes(self, fields):
         # sometimes the metadata has duplicate, identical entries for the same field.
         # they have different knack record IDs, so....?
@@ -134,12 +173,14 @@ class KnackTable(Table):
         else:
             return False
 
-    def to_sql(self):
-
+    def to_sql(self, constraints=True):
+        """
+        `CREATE TABLE` sql. If `constraints` is False, a bare table is created and
+        its constraints can be added after loading with `constraints_sql`.
+        """
         fields_sql = [
-            field.to_sql()
-            for field in self.fields
-            if not type(field) in [ConcatenationField, FormulaField, ManyToManyField]
+            field.to_sql(constraints=constraints)
+            for field in self.column_fields()
         ]
 
         fields_sql = f",\n{TAB}".join(fields_sql)
@@ -147,6 +188,118 @@ class KnackTable(Table):
         self.sql = f"""CREATE TABLE IF NOT EXISTS {self.name_postgres} (\n{TAB}{fields_sql}\n);\n\n"""
         return self.sql
 
+    def column_fields(self):
+        """
+        Fields which are columns of the table. Formulae only exist in views, unless
+        they are stored. Normalized one-to-many connections are columns of the child
+        table
+        """
+        return [
+            field
+            for field in self.fields
+            if (
+                not type(field) in [ConcatenationField, FormulaField, ManyToManyField]
+                or (isinstance(field, FormulaField) and field.stored)
+            )
+            and not (isinstance(field, ManyToOneField) and field.normalized)
+        ]
+
+    def knack_id_index_sql(self):
+        """
+        Deferred unique index on `knack_id`. Connection resolution joins on this
+        column, so it should be built as soon as records are loaded.
+        """
+        if self.associative:
+            # reference tables have no knack_id
+            return []
+
+        index_name = truncate_pg_name(f"{self.name_postgres}_knack_id_key")
+
+        return [
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {self.name_postgres} (knack_id);",
+            f"ALTER TABLE {self.name_postgres} ADD CONSTRAINT {index_name} UNIQUE USING INDEX {index_name};",
+        ]
+
+    def indexes(self):
+        """
+        Indexes on the columns which views and connection resolution join on: btree
+        indexes on scalar connection columns (including those of normalized
+        one-to-many connections) and on the `*_id` columns of reference tables, and
+        GIN indexes on one-to-many connection arrays. Generated subfield columns are
+        indexed as configured in `GENERATED_SUBFIELDS`. `knack_id` is
+        always unique, so it is indexed by its constraint.
+        """
+        indexes = []
+
+        for field in self.column_fields():
+            if self.associative and not field.is_primary_key:
+                indexes.append(
+                    Index(self.name_postgres, [field.name_postgres], reason="reference")
+                )
+
+            elif isinstance(field, ChildConnectionField):
+                indexes.append(
+                    Index(self.name_postgres, [field.name_postgres], reason="connection")
+                )
+
+            elif isinstance(field, ManyToOneField):
+                method = "gin" if field.data_type.endswith("[]") else "btree"
+
+                indexes.append(
+                    Index(
+                        self.name_postgres,
+                        [field.name_postgres],
+                        method=method,
+                        reason="connection",
+                    )
+                )
+
+        for field in self.fields:
+            generated_fields = getattr(field, "generated_fields", None)
+
+            if not generated_fields:
+                continue
+
+            for keys in GENERATED_SUBFIELDS[field.type_knack]["indexes"]:
+                indexes.append(
+                    Index(
+                        self.name_postgres,
+                        [generated_fields[key].name_postgres for key in keys],
+                        reason="subfield",
+                    )
+                )
+
+        return indexes
+
+    def index_sql(self):
+        return [index.to_sql() for index in self.indexes()]
+
+    def constraints_sql(self):
+        """
+        Deferred primary key and field constraints, which are omitted from
+        `to_sql(constraints=False)`. The `knack_id` constraint is handled separately by
+        `knack_id_index_sql`.
+        """
+        statements = [f"ALTER TABLE {self.name_postgres} ADD PRIMARY KEY (id);"]
+
+        for field in self.column_fields():
+            if field.name_postgres == "knack_id" or isinstance(field, ManyToOneField):
+                # connection field constraints are not enforced (see ManyToOneField)
+                continue
+
+            for constraint in field.constraints or []:
+                if constraint == "NOT NULL":
+                    statements.append(
+                        f"ALTER TABLE {self.name_postgres} ALTER COLUMN {field.name_postgres} SET NOT NULL;"
+                    )
+
+                elif constraint == "UNIQUE":
+                    statements.append(
+                        f"ALTER TABLE {self.name_postgres} ADD UNIQUE ({field.name_postgres});"
+                    )
+
+        return statements
+
     def create_field_map(self):
 
         self.field_map = {}
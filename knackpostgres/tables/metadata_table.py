@@ -42,7 +42,7 @@ class MetaTable(Table):
                 # try to access property at field.abc.xyz
                 accessors = metafield.accessor.split(".")
                 subclass = getattr(field, accessors[0])
-                val = getattr(field, accessors[1])
+                val = getattr(subclass, accessors[1])
 
             except (IndexError, AttributeError):
                 pass
@@ -81,12 +81,13 @@ class MetaTable(Table):
         else:
             return field.type_knack
 
-    def to_sql(self):
-        sql = []
-
-        fields_sql = [field.to_sql() for field in self.fields]
+    def to_sql(self, constraints=True):
+        fields_sql = [field.to_sql(constraints=constraints) for field in self.fields]
 
         all_fields_sql = f",\n    ".join(fields_sql)
 
         self.sql = f"""CREATE TABLE IF NOT EXISTS {self.schema}.{self.name_postgres} (\n    {all_fields_sql}\n);\n\n"""
         return self.sql
+
+    def constraints_sql(self):
+        return [f"ALTER TABLE {self.schema}.{self.name_postgres} ADD PRIMARY KEY (id);"]
@@ -0,0 +1,192 @@
+from knackpostgres.config.constants import TAB
+from knackpostgres.fields.formula_field import FormulaField
+from knackpostgres.utils.utils import truncate_pg_name
+
+
+class StoredFormulas:
+    """
+    Generate the sql which maintains a table's stored formula columns.
+
+    Stored formulas are computed once by `backfill_sql`, after records have been
+    loaded and connected. From then on, row triggers on the related tables (or the
+    reference table, for many-to-many connections) recompute the formulas of the
+    affected host records whenever related records change.
+    """
+
+    def __repr__(self):
+        return f"<StoredFormulas {self.table.name_postgres}>"
+
+    def __init__(self, table):
+        self.table = table
+
+        self.name = table.name_postgres
+
+        self.fields = [
+            field
+            for field in table.fields
+            if isinstance(field, FormulaField) and field.stored
+        ]
+
+        # formulas which aggregate over the same connection are computed together
+        self.groups = {}
+
+        for field in self.fields:
+            self.groups.setdefault((field.group_from, field.group_key), []).append(
+                field
+            )
+
+        self.groups = list(self.groups.values())
+
+        # formulas of stored formulas must be backfilled after them
+        self.depends_on = list(
+            dict.fromkeys(
+                field.rel_base_table_name
+                for field in self.fields
+                if isinstance(field.dest_field, FormulaField)
+            )
+        )
+
+    def backfill_sql(self):
+        """ Compute the stored formulas of every record, one statement per connection """
+        statements = []
+
+        for i, fields in enumerate(self.groups):
+            alias = f"_formulas_{i}"
+            group_from, group_key = fields[0].group_from, fields[0].group_key
+
+            aggregates = [f"{group_key} AS _host_id"] + [
+                f"{field.aggregate} AS {field.name_postgres}" for field in fields
+            ]
+
+            aggregates = ", ".join(aggregates)
+
+            assignments = ", ".join(
+                f"{field.name_postgres} = {self._column(field, alias)}"
+                for field in fields
+            )
+
+            statements.append(
+                f"""UPDATE {self.name} SET {assignments}\n FROM {self.name} AS _host LEFT OUTER JOIN (SELECT {aggregates} FROM {group_from} GROUP BY {group_key}) AS {alias} ON ({alias}._host_id = _host.id)\n WHERE _host.id = {self.name}.id;"""
+            )
+
+        return statements
+
+    def trigger_sql(self):
+        """
+        Trigger functions and triggers which recompute the stored formulas when
+        related records are inserted, updated or deleted
+        """
+        statements = []
+
+        for i, fields in enumerate(self.groups):
+            field = fields[0]
+            function_name = f"{self.name}_formulas_{i}"
+
+            statements += self._join_trigger(truncate_pg_name(function_name), fields)
+
+            if field.join_table_name != field.rel_base_table_name:
+                # many-to-many formulas also change with the values of related records
+                statements += self._rel_trigger(
+                    truncate_pg_name(f"{function_name}_rel"), fields
+                )
+
+        return statements
+
+    def _join_trigger(self, function_name, fields):
+        """
+        Trigger on the table which holds the host id, i.e. the related table or the
+        reference table. Both the old and the new host are recomputed when a record
+        is moved to another host.
+        """
+        field = fields[0]
+        column = field.join_column
+
+        watched = [column] + self._dest_columns(fields)
+
+        if field.join_table_name != field.rel_base_table_name:
+            watched = [column, f"{field.rel_base_table_name}_id"]
+
+        body = f"""IF TG_OP = 'DELETE' THEN
+        {self._recompute(fields, f"= OLD.{column}")}
+    ELSIF TG_OP = 'INSERT' THEN
+        {self._recompute(fields, f"= NEW.{column}")}
+    ELSE
+        {self._recompute(fields, f"= NEW.{column}")}
+
+        IF OLD.{column} IS DISTINCT FROM NEW.{column} THEN
+            {self._recompute(fields, f"= OLD.{column}")}
+        END IF;
+    END IF;"""
+
+        return self._trigger(
+            function_name,
+            body,
+            field.join_table_name,
+            f"INSERT OR DELETE OR UPDATE OF {', '.join(dict.fromkeys(watched))}",
+        )
+
+    def _rel_trigger(self, function_name, fields):
+        """
+        Trigger on the related table of a many-to-many connection, which recomputes
+        every host connected to a changed record
+        """
+        field = fields[0]
+
+        dest_columns = self._dest_columns(fields)
+
+        if not dest_columns:
+            # counts don't change with the values of related records
+            return []
+
+        body = f"""IF TG_OP = 'DELETE' THEN
+        {self._recompute(fields, self._connected_hosts(field, "OLD"))}
+    ELSE
+        {self._recompute(fields, self._connected_hosts(field, "NEW"))}
+    END IF;"""
+
+        return self._trigger(
+            function_name,
+            body,
+            field.rel_base_table_name,
+            f"DELETE OR UPDATE OF {', '.join(dest_columns)}",
+        )
+
+    def _connected_hosts(self, field, record):
+        ref = field.join_table_name
+        return f"IN (SELECT {ref}.{field.join_column} FROM {ref} WHERE {ref}.{field.rel_base_table_name}_id = {record}.id)"
+
+    def _trigger(self, function_name, body, table_name, events):
+        return [
+            f"""CREATE OR REPLACE FUNCTION {function_name}() RETURNS trigger AS $$\nBEGIN\n{TAB}{body}\n\n{TAB}RETURN NULL;\nEND;\n$$ LANGUAGE plpgsql;""",
+            f"DROP TRIGGER IF EXISTS {function_name} ON {table_name};",
+            f"CREATE TRIGGER {function_name} AFTER {events} ON {table_name} FOR EACH ROW EXECUTE PROCEDURE {function_name}();",
+        ]
+
+    def _recompute(self, fields, host_condition):
+        """ Update the formulas of the hosts whose id matches `host_condition` """
+        assignments = ", ".join(
+            f"{field.name_postgres} = {self._subquery(field)}" for field in fields
+        )
+
+        return f"UPDATE {self.name} SET {assignments} WHERE {self.name}.id {host_condition};"
+
+    def _subquery(self, field):
+        # unlike the grouped join of `backfill_sql`, this counts 0 for hosts
+        # without related records
+        return f"(SELECT {field.aggregate} FROM {field.group_from} WHERE {field.group_key} = {self.name}.id)"
+
+    def _column(self, field, alias):
+        column = f"{alias}.{field.name_postgres}"
+
+        if field.method == "COUNT":
+            # hosts without related records have no group to count
+            column = f"COALESCE({column}, 0)"
+
+        return column
+
+    def _dest_columns(self, fields):
+        return list(
+            dict.fromkeys(
+                field.dest_field_name for field in fields if field.dest_field_name != "id"
+            )
+        )
@@ -3,25 +3,35 @@ from pprint import pprint as print
 from knackpostgres.config.constants import TAB
 from knackpostgres.fields.concatenation_field import ConcatenationField
 from knackpostgres.fields.formula_field import FormulaField
+from knackpostgres.utils.utils import truncate_pg_name
 
 
 class View:
-    """ Generate Postgres table view sql of all table columns plus formula fields """
+    """
+    Generate Postgres table view sql of all table columns plus formula fields.
+
+    With `materialized`, the view is created as a materialized view with a unique
+    index on `id`, so that it can be refreshed concurrently.
+    """
 
     def __repr__(self):
         return f"<View {self.name}>"
 
-    def __init__(self, table):
+    def __init__(self, table, materialized=False):
         # where data is knack "objects" list from app data
 
         self.table = table
 
+        self.materialized = materialized
+
+        self.kind = "MATERIALIZED VIEW" if materialized else "VIEW"
+
         self.name = f"{table.name_postgres}_view"
 
         self.formula_fields = [
             field
             for field in self.table.fields
-            if isinstance(field, FormulaField) and field.sql
+            if isinstance(field, FormulaField) and field.sql and not field.stored
         ]
 
         self.concat_fields = [
@@ -34,10 +44,41 @@ class View:
 
         self._create_join_clauses()
 
+        self._create_formula_joins()
+
         self.sql = self._to_sql()
 
     def _set_dependencies(self):
-        self.depends_on = [field.rel_table_name for field in self.formula_fields]
+        """
+        `depends_on` holds the views this view selects from. formulas aggregate
+        over the related table's view, so that formulas of formulas resolve.
+
+        `depends_on_tables` holds every table this view reads, including those
+        joined for concatenations.
+        """
+        self.depends_on = list(
+            dict.fromkeys(field.rel_view_name for field in self.formula_fields)
+        )
+
+        self.depends_on_tables = list(
+            dict.fromkeys(
+                [self.table.name_postgres]
+                + [
+                    conn_field.rel_table_name
+                    for field in self.concat_fields
+                    for conn_field in field.connection_fields
+                ]
+                + [
+                    field.rel_base_table_name
+                    for field in self.formula_fields
+                ]
+                + [
+                    field.reference_table_name
+                    for field in self.formula_fields
+                    if getattr(field, "reference_table_name", None)
+                ]
+            )
+        )
 
     def _create_join_clauses(self):
         """
@@ -59,13 +100,74 @@ class View:
 
         self.joins = "\n ".join(joins)
 
+    def _create_formula_joins(self):
+        """
+        Rather than computing each formula with a correlated subquery per row, the
+        formulas which aggregate over the same connection are computed together in
+        one grouped subquery, which is left-joined to the table on the host id. The
+        planner can hash-join these, instead of running a nested loop per formula.
+
+        Sets `formula_columns` to the select expression of each formula field.
+        """
+        groups = {}
+
+        for field in self.formula_fields:
+            if not getattr(field, "group_key", None):
+                continue
+
+            groups.setdefault((field.group_from, field.group_key), []).append(field)
+
+        self.formula_columns = {}
+
+        joins = []
+
+        for i, ((group_from, group_key), fields) in enumerate(groups.items()):
+            alias = f"_formulas_{i}"
+
+            aggregates = [f"{group_key} AS _host_id"] + [
+                f"{field.aggregate} AS {field.name_postgres}" for field in fields
+            ]
+
+            aggregates = ", ".join(aggregates)
+
+            joins.append(
+                f"""LEFT OUTER JOIN (SELECT {aggregates} FROM {group_from} GROUP BY {group_key}) AS {alias} ON ({alias}._host_id = {self.table.name_postgres}.id)"""
+            )
+
+            for field in fields:
+                column = f"{alias}.{field.name_postgres}"
+
+                if field.method == "COUNT":
+                    # hosts without related records have no group to count
+                    column = f"COALESCE({column}, 0)"
+
+                self.formula_columns[
+                    field.name_postgres
+                ] = f"{column} AS {field.name_postgres}"
+
+        self.formula_joins = "\n ".join(joins)
+
     def _to_sql(self):
         sql = [f"SELECT {self.table.name_postgres}.*"]
 
-        sql += [field.sql for field in self.formula_fields]
+        sql += [
+            self.formula_columns.get(field.name_postgres, field.sql)
+            for field in self.formula_fields
+        ]
 
         sql += [field.sql for field in self.concat_fields]
 
         sql = f",\n{TAB}".join(sql)
 
-        return f"""CREATE VIEW {self.name} AS\n{TAB}{sql}\n FROM {self.table.name_postgres} {self.joins};\n\n"""
+        sql = f"""CREATE {self.kind} {self.name} AS\n{TAB}{sql}\n FROM {self.table.name_postgres} {self.joins} {self.formula_joins};\n\n"""
+
+        if self.materialized:
+            # concurrent refreshes require a unique index
+            index_name = truncate_pg_name(f"{self.name}_id_key")
+            sql += f"""CREATE UNIQUE INDEX {index_name} ON {self.name} (id);\n\n"""
+
+        return sql
+
+    def refresh_sql(self, concurrently=True):
+        concurrently = " CONCURRENTLY" if concurrently else ""
+        return f"REFRESH MATERIALIZED VIEW{concurrently} {self.name};"
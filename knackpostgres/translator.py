@@ -1,15 +1,17 @@
+from collections import namedtuple
 import csv
 import json
 import logging
 from pathlib import Path
 import re
+import weakref
 
 import requests
 
 from knackpostgres.fields.many_to_one_field import ManyToOneField
 from knackpostgres.fields.many_to_many_field import ManyToManyField
-from knackpostgres.utils.data_handlers import DataHandlers
-from knackpostgres.utils.utils import escape_single_quotes, wrap_single_quotes
+from knackpostgres.utils.data_handlers import get_handler
+from knackpostgres.utils.utils import chunks, escape_single_quotes, wrap_single_quotes
 
 
 # TODO: you're better than this
@@ -24,6 +26,14 @@ IGNORE_FIELD_TYPES = [
     "equation",
 ]
 
+# a column of a translation plan: the knack field key, its "raw" key, the handler
+# function which translates its values, and the destination postgres fieldname
+Column = namedtuple("Column", ["key", "raw_key", "handler", "name"])
+
+# compiled translation plans, by `KnackTable`. each is stored with the signature of
+# the table's field map it was compiled from, and recompiled if the fields change
+_COLUMN_PLANS = weakref.WeakKeyDictionary()
+
 TEMPLATE = """
 mutation insert_fields {
   insert_$table(objects: [$objects])
@@ -151,12 +161,72 @@ class KnackTranslator(Translator):
         if not self.knack.data_raw:
             raise IndexError(f"No records found at {self.knack.obj}")
 
-        self.knack.data_raw = self._replace_raw_fieldnames()
-        self.data = self._translate_records()
-        self.data = self._convert_fieldnames()
-        self.connection_data = self._extract_one_to_many_connections()
-        self.connection_data += self._extract_many_to_many_connections()
-        self._drop_connection_fields()
+        self._prepare(self.knack.fields)
+
+        self.data, self.connection_data = self.translate_batch(self.knack.data_raw)
+
+    def translate_batch(self, records):
+        """
+        Translate a list of raw knack records in a single pass. Returns a tuple of
+        (translated rows, connection records).
+        """
+        rows = []
+        connection_data = []
+
+        # a streaming translator may outlive changes to its table's fields
+        self.column_plan = self._column_plan()
+
+        for record in records:
+            row = self._translate_record(record)
+            connection_data += self._extract_connections(row)
+            rows.append(row)
+
+        return rows, connection_data
+
+    def _prepare(self, fields):
+        # where `fields` is knack field metadata, keyed by field key
+        self.fields = fields
+
+        self.conn_fields = {
+            field.name_postgres: field
+            for field in self.table.fields
+            if isinstance(field, ManyToOneField) or isinstance(field, ManyToManyField)
+        }
+
+        self.column_plan = self._column_plan()
+
+        self._warn_undefined()
+
+    def _column_plan(self):
+        """
+        The translation plan is compiled once per table, and lists the columns to
+        be extracted from each record along with their handler functions.
+        """
+        signature = tuple(
+            (key, field["type"], field["name"])
+            for key, field in self.table.field_map.items()
+        )
+
+        cached = _COLUMN_PLANS.get(self.table)
+
+        if not cached or cached[0] != signature:
+            _COLUMN_PLANS[self.table] = (signature, self._compile_column_plan())
+
+        return _COLUMN_PLANS[self.table][1]
+
+    def _compile_column_plan(self):
+        # our App class expects knack ids to be represented with a "knack_id" fieldname
+        plan = [Column("id", None, lambda val: val, "knack_id")]
+
+        for key, field in self.table.field_map.items():
+            if field["type"] in IGNORE_FIELD_TYPES or field["type"] == "_knack_id":
+                continue
+
+            plan.append(
+                Column(key, f"{key}_raw", get_handler(field["type"]), field["name"])
+            )
+
+        return plan
 
     def connections_sql(self):
         if not self.connection_data:
@@ -176,41 +246,38 @@ class KnackTranslator(Translator):
             WHERE {kwargs["rel_table_name"]}.knack_id = '{kwargs["conn_record_id"]}')
             WHERE knack_id = '{kwargs["knack_id"]}';"""
 
-    def _extract_one_to_many_connections(self):
-
-        conn_fields = {
-            field.name_postgres: field
-            for field in self.table.fields
-            if isinstance(field, ManyToOneField)
-        }
+    def _extract_connections(self, row):
+        """
+        Pop connection fields from a translated row and return them as connection
+        records. We handle connection fields after all records have been loaded.
+        """
+        conn_data = []
 
-        if not conn_fields:
-            return []
+        for field_name, field in self.conn_fields.items():
+            vals = row.pop(field_name, None)
 
-        conn_data = []
+            if not vals:
+                continue
 
-        for record in self.data:
-            for field in record.keys():
-                if field in conn_fields:
-                    vals = record[field]
-                    if not vals:
-                        continue
-
-                    rel_table_name = conn_fields[field].rel_table_name
-
-                    if isinstance(vals, list):
-                        for val in vals:
-                            conn_data.append(
-                                self._connection_record(
-                                    field, record["knack_id"], val["id"], rel_table_name
-                                )
-                            )
-                    else:
-                        conn_data.append(
-                            self._connection_record(
-                                field, record["knack_id"], vals["id"], rel_table_name
-                            )
-                        )
+            if not isinstance(vals, list):
+                vals = [vals]
+
+            reference_table_name = (
+                field.reference_table_name
+                if isinstance(field, ManyToManyField)
+                else None
+            )
+
+            for val in vals:
+                conn_data.append(
+                    self._connection_record(
+                        field_name,
+                        row["knack_id"],
+                        val["id"],
+                        field.rel_table_name,
+                        reference_table_name=reference_table_name,
+                    )
+                )
 
         return conn_data
 
@@ -231,69 +298,6 @@ class KnackTranslator(Translator):
             "reference_table_name": reference_table_name,
         }
 
-    def _drop_connection_fields(self):
-        # we handle conenciton fields with udpate statements
-        # so drop them to keep them out of view of loader.insert_each
-        conn_fieldnames = {
-            field.name_postgres
-            for field in self.table.fields
-            if isinstance(field, ManyToOneField) or isinstance(field, ManyToManyField)
-        }
-
-        for record in self.data:
-            for fname in conn_fieldnames:
-                try:
-                    record.pop(fname)
-                except KeyError:
-                    pass
-        return None
-
-    def _extract_many_to_many_connections(self):
-        # todo: handle these fields
-        conn_fields = {
-            field.name_postgres: field
-            for field in self.table.fields
-            if isinstance(field, ManyToManyField)
-        }
-
-        if not conn_fields:
-            return []
-
-        conn_data = []
-
-        for record in self.data:
-            for field in record.keys():
-                if field in conn_fields:
-                    vals = record[field]
-
-                    if not vals:
-                        continue
-
-                    rel_table_name = conn_fields[field].rel_table_name
-                    reference_table_name = conn_fields[field].reference_table_name
-                    if isinstance(vals, list):
-                        for val in vals:
-                            conn_data.append(
-                                self._connection_record(
-                                    field,
-                                    record["knack_id"],
-                                    val["id"],
-                                    rel_table_name,
-                                    reference_table_name=reference_table_name,
-                                )
-                            )
-                    else:
-                        conn_data.append(
-                            self._connection_record(
-                                field,
-                                record["knack_id"],
-                                vals["id"],
-                                rel_table_name,
-                                reference_table_name=reference_table_name,
-                            )
-                        )
-        return conn_data
-
     def _insert_statement_many_to_many(self, **kwargs):
 
         return f"""
@@ -303,112 +307,62 @@ class KnackTranslator(Translator):
             );
         """
 
-    def _translate_records(self):
-        translated_records = []
-
-        for record in self.knack.data_raw:
-            translated_record = {}
-
-            for field in record.keys():
-
-                try:
-                    field_type = self.knack.fields.get(field).get("type")
-
-                except AttributeError:
-                    # knack internal fields are not exposed in field metadata
-                    # which is fine, we skip them
-                    continue
-
-                if field_type in IGNORE_FIELD_TYPES:
-                    continue
-
-                # use the DataHandler to translate the data based on field type
-                handler = DataHandlers(field_type)
-
-                translated_record[field] = handler.handle(record[field])
+    def _translate_record(self, record):
+        translated_record = {}
 
-            translated_records.append(translated_record)
+        for column in self.column_plan:
+            # for any Knack field that has both a "raw" and formatted field, use the raw field
+            if column.raw_key in record:
+                val = record[column.raw_key]
 
-        return translated_records
+            elif column.key in record:
+                val = record[column.key]
 
-    def _replace_raw_fieldnames(self):
-        """
-        For any Knack field that has both a "raw" and formatted field, use the raw field and drop the
-        formated (non-raw) field
-        """
-
-        # sample the first record to get all fieldnames
-        # todo: this assumes all records have all fields, which is not gauraunteed
-        # inspect knack data to hardcode which fields have raw fields
-        record = self.knack.data_raw[0]
-
-        raw_fields = [
-            field.split("_raw")[0] for field in record.keys() if field.endswith("_raw")
-        ]
-
-        new_records = []
+            else:
+                continue
 
-        for record in self.knack.data_raw:
+            translated_record[column.name] = column.handler(val)
 
-            new_record = {}
+        return translated_record
 
-            for field in record.keys():
+    def _warn_undefined(self):
+        for key, field in self.fields.items():
+            if key == "id" or key in self.table.field_map:
+                continue
 
-                # lookup the destination postgres fieldname and replace keys accordingly
-                if field == "id":
-                    new_field = field
+            if field.get("type") in IGNORE_FIELD_TYPES:
+                continue
 
-                elif field.endswith("_raw"):
-                    new_field = field.split("_raw")[0]
+            # field was not defined. probably a passwordfield
+            print(
+                f"Warning: {field.get('label')} ({key}) is not defined and will be ignored."
+            )
 
-                elif field not in raw_fields:
-                    # this field does not have a raw field, so use this one
-                    new_field = field
 
-                else:
-                    # ignore the field, assuming it's a dupe of the "raw" field
-                    continue
+class StreamingKnackTranslator(KnackTranslator):
+    """
+    Translate Knack records in a single pass without holding an entire object in memory.
+    Whereas `KnackTranslator` translates all of an object's records on init, `translate`
+    consumes any iterator of raw records and yields translated batches, so memory is
+    bounded by the batch size rather than the size of the object.
+    """
 
-                new_record[new_field] = record[field]
+    def __repr__(self):
+        return f"<StreamingKnackTranslator {self.table.name_postgres}>"
 
-            new_records.append(new_record)
+    def __init__(self, table, fields=None):
+        Translator.__init__(self, table, None)
 
-        return new_records
+        # where `fields` is knack field metadata keyed by field key. by default, we use
+        # the field definitions of the table's knack object
+        self._prepare(
+            fields or {field["key"]: field for field in self.table.fields_knack}
+        )
 
-    def _convert_fieldnames(self):
+    def translate(self, records, batch_size=1000):
         """
-        Lookup the destination postgres fieldname and replace keys accordingly
+        Yield (translated rows, connection records) tuples for each `batch_size`
+        records of `records`
         """
-        new_records = []
-
-        for record in self.data:
-            new_record = {}
-
-            for field in record.keys():
-
-                if field == "profile_keys_raw":
-                    # ignore this knack meta field
-                    # todo: move elsewher
-                    continue
-
-                if field == "id":
-                    # our App class expects knack ids to be represented with a "knack_id" fieldname
-                    converted_field_name = "knack_id"
-
-                else:
-                    try:
-                        converted_field_name = self.table.field_map.get(field).get(
-                            "name"
-                        )
-                    except AttributeError:
-                        # field was not defined. probably a passwordfield
-                        print(
-                            f"Warning: {self.knack.fields[field]['label']} ({field}) is not defined and will be ignored."
-                        )
-                        continue
-
-                new_record[converted_field_name] = record[field]
-
-            new_records.append(new_record)
-
-        return new_records
+        for batch in chunks(records, batch_size):
+            yield self.translate_batch(batch)
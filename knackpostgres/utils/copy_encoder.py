@@ -0,0 +1,118 @@
+"""
+Encode translated record values as fields of a PostgreSQL `COPY` text-format stream.
+
+Docs: https://www.postgresql.org/docs/current/sql-copy.html
+"""
+from decimal import Decimal
+import json
+
+# `COPY` text format represents NULL with an (unquoted) `\N`
+NULL = "\\N"
+
+
+def _escape(string):
+    """ Escape the characters that have special meaning in `COPY` text format """
+    return (
+        string.replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+    )
+
+
+def _text(val):
+    return str(val)
+
+
+def _integer(val):
+    # whole numbers may be translated as floats, e.g. `5.0`, which integer
+    # columns reject
+    return format(Decimal(str(val)).normalize(), "f")
+
+
+def _boolean(val):
+    if isinstance(val, str):
+        return "t" if val.lower() in ["true", "t", "yes", "1"] else "f"
+
+    return "t" if val else "f"
+
+
+def _json(val):
+    return json.dumps(val)
+
+
+def _timestamp(val):
+    try:
+        return val.isoformat()
+
+    except AttributeError:
+        # knack timestamps are already iso strings
+        return str(val)
+
+
+def _date(val):
+    try:
+        return val.isoformat()
+
+    except AttributeError:
+        # the date part of an iso timestamp
+        return str(val)[:10]
+
+
+ENCODERS = {
+    "TEXT": _text,
+    "NUMERIC": _text,
+    "SMALLINT": _integer,
+    "INTEGER": _integer,
+    "BIGINT": _integer,
+    "DATE": _date,
+    "BOOLEAN": _boolean,
+    "JSON": _json,
+    "JSONB": _json,
+    "TIMESTAMP WITH TIME ZONE": _timestamp,
+}
+
+
+def _array_element(val, encoder):
+    if val is None:
+        return "NULL"
+
+    val = encoder(val).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{val}"'
+
+
+def get_encoder(data_type):
+    """
+    Return a function which converts a python value to a `COPY` field for the
+    given postgres `data_type`. Array types (e.g. `TEXT[]`) are encoded as postgres
+    array literals.
+    """
+    base_type = data_type.replace("[]", "")
+
+    encoder = ENCODERS.get(base_type, _text)
+
+    if not data_type.endswith("[]"):
+        return lambda val: NULL if val is None else _escape(encoder(val))
+
+    def encode_array(val):
+        if val is None:
+            return NULL
+
+        if not isinstance(val, (list, tuple)):
+            # a single value destined for an array column
+            val = [val]
+
+        elements = ",".join(_array_element(elem, encoder) for elem in val)
+        return _escape(f"{{{elements}}}")
+
+    return encode_array
+
+
+def encode_row(record, columns, encoders):
+    """ Encode a record dict as a single line of `COPY` text-format data """
+    return (
+        "\t".join(
+            encoder(record.get(column)) for column, encoder in zip(columns, encoders)
+        )
+        + "\n"
+    )
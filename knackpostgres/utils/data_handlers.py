@@ -1,5 +1,14 @@
 import json
 
+
+def get_handler(field_type):
+    """
+    Return the handler function for a knack field type, for translating many values
+    without instanciating a `DataHandlers` per value
+    """
+    return DataHandlers(field_type).handler
+
+
 class DataHandlers:
     """ Handlers for translating Knack record values to destination DB values """
 
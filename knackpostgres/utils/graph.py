@@ -0,0 +1,70 @@
+from knackpostgres.exceptions.exceptions import DependencyCycleError
+
+
+def topological_levels(dependencies):
+    """
+    Sort a dependency graph with Kahn's algorithm.
+
+    `dependencies` is a dict of node: iterable of the nodes it depends on.
+    Dependencies which are not themselves nodes are ignored.
+
+    Returns a list of levels, each a list of nodes whose dependencies are all
+    satisfied by the levels before it. Nodes within a level do not depend on
+    one another and keep their input order.
+
+    Raises `DependencyCycleError` if the graph has a cycle.
+    """
+    depends_on = {
+        node: {dep for dep in deps if dep in dependencies}
+        for node, deps in dependencies.items()
+    }
+
+    dependents = {node: [] for node in depends_on}
+
+    for node, deps in depends_on.items():
+        for dep in deps:
+            dependents[dep].append(node)
+
+    remaining = {node: len(deps) for node, deps in depends_on.items()}
+
+    levels = []
+
+    level = [node for node in depends_on if not remaining[node]]
+
+    while level:
+        levels.append(level)
+
+        next_level = []
+
+        for node in level:
+            for dependent in dependents[node]:
+                remaining[dependent] -= 1
+
+                if not remaining[dependent]:
+                    next_level.append(dependent)
+
+        level = next_level
+
+    cyclic = [node for node in depends_on if remaining[node]]
+
+    # drop the unsorted nodes which merely depend on a cycle, so the error
+    # names only the nodes in it
+    while True:
+        depended_on = {dep for node in cyclic for dep in depends_on[node]}
+        trimmed = [node for node in cyclic if node in depended_on]
+
+        if len(trimmed) == len(cyclic):
+            break
+
+        cyclic = trimmed
+
+    if cyclic:
+        edges = ", ".join(
+            f"{node} -> {dep}"
+            for node in cyclic
+            for dep in sorted(depends_on[node])
+            if dep in cyclic
+        )
+        raise DependencyCycleError(f"Circular dependencies found: {edges}")
+
+    return levels
@@ -0,0 +1,45 @@
+"""
+Page through records of a Knack object without loading the whole object into memory.
+
+Docs: https://docs.knack.com/docs/object-based-get-requests
+"""
+import json
+
+import requests
+
+ENDPOINT = "https://api.knack.com/v1/objects/{obj}/records"
+
+# the maximum allowed by the Knack API
+ROWS_PER_PAGE = 1000
+
+
+def get_record_pages(
+    app_id, api_key, obj, rows_per_page=ROWS_PER_PAGE, filters=None, start_page=1
+):
+    """
+    Yield (page number, records) tuples for each page of records in Knack object `obj`,
+    beginning at `start_page`. `filters` is an optional list of Knack filter rules,
+    which are combined with "and".
+    """
+    headers = {
+        "X-Knack-Application-Id": app_id,
+        "X-Knack-REST-API-Key": api_key,
+    }
+
+    params = {"rows_per_page": rows_per_page, "page": start_page}
+
+    if filters:
+        params["filters"] = json.dumps({"match": "and", "rules": filters})
+
+    while True:
+        res = requests.get(ENDPOINT.format(obj=obj), headers=headers, params=params)
+        res.raise_for_status()
+        data = res.json()
+
+        if data["records"]:
+            yield params["page"], data["records"]
+
+        if params["page"] >= int(data["total_pages"]):
+            break
+
+        params["page"] += 1
@@ -0,0 +1,49 @@
+class LoadLedger:
+    """
+    Records the progress of `Loader.load_app` in the metadata schema so that a failed
+    load can be resumed. Progress is recorded in the same transaction as the work it
+    describes, so the ledger never claims work that was not committed.
+
+    Each entry is a (table name, phase, batch) tuple. Table name and batch are null
+    for app-wide phases, such as "connections".
+    """
+
+    def __repr__(self):
+        return f"<LoadLedger {self.table_name}> ({len(self.completed)} entries)"
+
+    def __init__(self, schema, name="_load_progress"):
+        self.table_name = f"{schema}.{name}"
+        self.completed = set()
+
+    def create_sql(self):
+        return f"""CREATE TABLE IF NOT EXISTS {self.table_name} (
+    table_name TEXT,
+    phase TEXT NOT NULL,
+    batch INTEGER,
+    completed_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);"""
+
+    def reset_sql(self):
+        return f"TRUNCATE {self.table_name};"
+
+    def read(self, cursor):
+        cursor.execute(f"SELECT table_name, phase, batch FROM {self.table_name};")
+        self.completed = set(cursor.fetchall())
+        return self
+
+    def is_complete(self, phase, table_name=None, batch=None):
+        return (table_name, phase, batch) in self.completed
+
+    def completed_batches(self, phase, table_name):
+        return {
+            batch
+            for (name, phase_, batch) in self.completed
+            if name == table_name and phase_ == phase and batch is not None
+        }
+
+    def record(self, cursor, phase, table_name=None, batch=None):
+        cursor.execute(
+            f"INSERT INTO {self.table_name} (table_name, phase, batch) VALUES (%s, %s, %s);",
+            (table_name, phase, batch),
+        )
+        self.completed.add((table_name, phase, batch))
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+import time
+
+
+class MetadataCache:
+    """
+    On-disk cache of Knack application metadata. Each app's metadata is stored at
+    `<path>/<app_id>.json` along with the time it was fetched and a hash of its
+    contents.
+    """
+
+    def __repr__(self):
+        return f"<MetadataCache {self.path}>"
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def get(self, app_id, max_age=None):
+        """
+        Return cached metadata for `app_id`, or None if it is not cached, is older
+        than `max_age` seconds, or fails its content hash check.
+        """
+        try:
+            with open(self._file_path(app_id), "r") as fin:
+                cached = json.load(fin)
+
+            if max_age is not None and time.time() - cached["fetched_at"] > max_age:
+                logging.info(f"Cached metadata for {app_id} is stale.")
+                return None
+
+            if content_hash(cached["metadata"]) != cached["hash"]:
+                raise ValueError("content hash does not match")
+
+        except FileNotFoundError:
+            return None
+
+        except (ValueError, KeyError, TypeError) as e:
+            # truncated, malformed or tampered cache files are treated as a miss
+            logging.warning(
+                f"Cached metadata for {app_id} is corrupt and will be ignored: {e}"
+            )
+            return None
+
+        return cached["metadata"]
+
+    def put(self, app_id, metadata):
+        """ Write metadata to the cache. Returns its content hash """
+        metadata_hash = content_hash(metadata)
+
+        # always rewritten, even if unchanged, to refresh its `fetched_at`
+        self.path.mkdir(exist_ok=True, parents=True)
+
+        with open(self._file_path(app_id), "w") as fout:
+            json.dump(
+                {
+                    "app_id": app_id,
+                    "fetched_at": time.time(),
+                    "hash": metadata_hash,
+                    "metadata": metadata,
+                },
+                fout,
+            )
+
+        return metadata_hash
+
+    def _file_path(self, app_id):
+        return self.path / f"{app_id}.json"
+
+
+def content_hash(metadata):
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True).encode()).hexdigest()
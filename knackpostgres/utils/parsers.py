@@ -1,6 +1,8 @@
 """
 Lark parser definitions for handling knack foruma fields.
 """
+import threading
+
 from lark import Lark
 
 CONCATENATION = r"""
@@ -37,11 +39,43 @@ CONCATENATION = r"""
     _COMMA: /,/
 """
 
-GRAMMARS = {"concatenation": {"grammar": CONCATENATION, "entry_point": "_values"}}
+GRAMMARS = {
+    "concatenation": {
+        "grammar": CONCATENATION,
+        "entry_point": "_values",
+        # the concatenation grammar relies on lookaheads and ambiguity, so it requires earley
+        "parser": "earley",
+    }
+}
+
+# compiled parsers, by grammar name
+_PARSERS = {}
+
+_PARSERS_LOCK = threading.Lock()
 
 
 def get_parser(grammar_name):
+    """
+    Return a Lark parser for `grammar_name`. The grammar is compiled once per process
+    and the parser is shared by all callers.
+    """
+    with _PARSERS_LOCK:
+        if grammar_name not in _PARSERS:
+            _PARSERS[grammar_name] = _build_parser(grammar_name)
+
+        return _PARSERS[grammar_name]
+
+
+def _build_parser(grammar_name):
     grammar = GRAMMARS[grammar_name]["grammar"]
     # # i find `start` to be confusing, hence renaming it to `entry_point` in config
     entry_point = GRAMMARS[grammar_name]["entry_point"]
-    return Lark(grammar, start=entry_point, debug=False, propagate_positions=True)
+    parser = GRAMMARS[grammar_name].get("parser", "earley")
+
+    return Lark(
+        grammar,
+        start=entry_point,
+        parser=parser,
+        debug=False,
+        propagate_positions=True,
+    )
@@ -0,0 +1,155 @@
+"""
+A minimal threaded pipeline. Each `Stage` runs in its own thread, pulling items from
+an inbox queue and pushing results to an outbox queue. Bounded queues between stages
+provide backpressure: a fast stage blocks once its downstream queue is full.
+"""
+import inspect
+from queue import Queue
+import threading
+import time
+
+# sentinel which signals the end of a stage's input
+DONE = object()
+
+
+class StageStats:
+    """ Counts and timing of the work done by a pipeline `Stage` """
+
+    def __repr__(self):
+        return f"<StageStats {self.name}> ({self.records} records, {self.throughput:.1f} records/s)"
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.records = 0
+
+        # time spent doing work, excluding time waiting on queues
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        return self.records / self.seconds if self.seconds else 0.0
+
+
+class Stage(threading.Thread):
+    """
+    Apply `func` to each item of `inbox`, putting non-None results in `outbox`.
+    `count` returns the number of records in a result, for throughput stats.
+
+    `stop` is an event shared by the stages of a pipeline, which is set when any of
+    them fails, so that the others stop working rather than finish their input.
+    """
+
+    def __init__(self, name, func, inbox, outbox=None, count=None, stop=None):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.count = count
+        self.stop = stop or threading.Event()
+        self.stats = StageStats(name)
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+
+            if item is DONE:
+                break
+
+            if self.stop.is_set():
+                # keep draining the inbox so upstream stages don't block forever
+                continue
+
+            try:
+                self._handle(item)
+
+            except Exception as e:
+                self.error = e
+                self.stop.set()
+
+        if self.outbox is not None:
+            self.outbox.put(DONE)
+
+    def _handle(self, item):
+        """
+        `func` may return a single result, or a generator of results which are passed
+        downstream as they are produced
+        """
+        start = time.perf_counter()
+
+        results = self.func(item)
+
+        if not inspect.isgenerator(results):
+            results = iter([results])
+
+        self.stats.items += 1
+
+        for result in results:
+            if self.stop.is_set():
+                # e.g. stop paging through records once a downstream stage has failed
+                if inspect.isgenerator(results):
+                    results.close()
+
+                break
+
+            # exclude time spent waiting on the outbox
+            self.stats.seconds += time.perf_counter() - start
+
+            if result is not None:
+                if self.count:
+                    self.stats.records += self.count(result)
+
+                if self.outbox is not None:
+                    self.outbox.put(result)
+
+            start = time.perf_counter()
+
+        self.stats.seconds += time.perf_counter() - start
+
+
+class Pipeline:
+    """
+    Chain a list of `(name, func, count)` stage definitions together with queues of
+    `queue_size` and run `items` through them.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        self.inbox = Queue()
+
+        # set by the first stage to fail
+        self.stop = threading.Event()
+
+        self.stages = []
+
+        inbox = self.inbox
+
+        for i, (name, func, count) in enumerate(stages):
+            is_last = i == len(stages) - 1
+            outbox = None if is_last else Queue(maxsize=queue_size)
+            self.stages.append(
+                Stage(name, func, inbox, outbox=outbox, count=count, stop=self.stop)
+            )
+            inbox = outbox
+
+    def run(self, items):
+        """ Run items through all stages. Returns a dict of stage name: `StageStats` """
+        for stage in self.stages:
+            stage.start()
+
+        for item in items:
+            if self.stop.is_set():
+                break
+
+            self.inbox.put(item)
+
+        self.inbox.put(DONE)
+
+        for stage in self.stages:
+            stage.join()
+
+        for stage in self.stages:
+            if stage.error:
+                raise stage.error
+
+        return {stage.name: stage.stats for stage in self.stages}
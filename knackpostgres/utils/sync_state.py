@@ -0,0 +1,43 @@
+class SyncState:
+    """
+    Records the high-water mark of each table synced by `Loader.sync`, i.e. the
+    latest modified date of its records, in the metadata schema. The next sync
+    fetches only the records modified since.
+    """
+
+    def __repr__(self):
+        return f"<SyncState {self.table_name}>"
+
+    def __init__(self, schema, name="_sync_state"):
+        self.table_name = f"{schema}.{name}"
+
+    def create_sql(self):
+        return f"""CREATE TABLE IF NOT EXISTS {self.table_name} (
+    table_name TEXT PRIMARY KEY,
+    field_key TEXT NOT NULL,
+    high_water_mark TIMESTAMP WITH TIME ZONE,
+    synced_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);"""
+
+    def read(self, cursor, table_name, field_key):
+        """
+        The high-water mark of a table, or None if it has not been synced by the
+        given modified date field
+        """
+        cursor.execute(
+            f"SELECT high_water_mark FROM {self.table_name} WHERE table_name = %s AND field_key = %s;",
+            (table_name, field_key),
+        )
+
+        row = cursor.fetchone()
+
+        return row[0] if row else None
+
+    def record(self, cursor, table_name, field_key, high_water_mark):
+        cursor.execute(
+            f"""INSERT INTO {self.table_name} (table_name, field_key, high_water_mark)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (table_name) DO UPDATE SET field_key = EXCLUDED.field_key,
+            high_water_mark = EXCLUDED.high_water_mark, synced_at = now();""",
+            (table_name, field_key, high_water_mark),
+        )
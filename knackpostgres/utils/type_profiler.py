@@ -0,0 +1,185 @@
+"""
+Profile translated records to find narrower column types than the defaults of
+`FIELD_DEFINITIONS`, e.g. `INTEGER` rather than `NUMERIC` for whole numbers.
+Only the types allowed by a field's knack type and format are considered.
+"""
+from decimal import Decimal, InvalidOperation
+import re
+
+# integer types, narrowest first, with their ranges
+INTEGER_TYPES = [
+    ("SMALLINT", -(2 ** 15), 2 ** 15 - 1),
+    ("INTEGER", -(2 ** 31), 2 ** 31 - 1),
+    ("BIGINT", -(2 ** 63), 2 ** 63 - 1),
+]
+
+# knack field types which may be narrowed to an integer type. currencies are left
+# alone: a sample without cents doesn't mean the next record won't have them
+INTEGER_FIELD_TYPES = ["number", "rating", "auto_increment"]
+
+# knack field types which may be narrowed to `SMALLINT`. other whole numbers are
+# narrowed to `INTEGER` at least, leaving headroom for values loaded later
+SMALLINT_FIELD_TYPES = ["rating"]
+
+# the `time_format` of date fields which have no time
+DATE_ONLY_TIME_FORMAT = "Ignore Time"
+
+# iso timestamps at midnight utc, e.g. `2020-01-31T00:00:00.000Z`
+MIDNIGHT_UTC = re.compile(r"T00:00(:00(\.0+)?)?(Z|[+-]00:?00)?$")
+
+
+def narrower_types(field):
+    """
+    The types which a field's column may be narrowed to, as allowed by its knack
+    type and format. Profiling only chooses among them, because the records
+    loaded so far can't tell us what later records will hold.
+    """
+    if field.is_primary_key:
+        return []
+
+    type_knack = getattr(field, "type_knack", None)
+    format_knack = getattr(field, "format_knack", None) or {}
+
+    if type_knack == "date_time":
+        # dates whose time is ignored, rather than times which happen to be midnight
+        if format_knack.get("time_format") == DATE_ONLY_TIME_FORMAT:
+            return ["DATE"]
+
+        return []
+
+    if type_knack not in INTEGER_FIELD_TYPES or _allows_fractions(format_knack):
+        return []
+
+    return [
+        data_type
+        for data_type, lower, upper in INTEGER_TYPES
+        if data_type != "SMALLINT" or type_knack in SMALLINT_FIELD_TYPES
+    ]
+
+
+def _allows_fractions(format_knack):
+    if format_knack.get("allow_half"):
+        # half-star ratings
+        return True
+
+    try:
+        return int(format_knack.get("precision") or 0) > 0
+
+    except (TypeError, ValueError):
+        return False
+
+
+class ColumnProfile:
+    """ Tracks whether the values of a column fit a narrower type """
+
+    def __init__(self, field):
+        self.field = field
+        self.candidates = narrower_types(field)
+        self.count = 0
+        self.min = None
+        self.max = None
+
+        # the column can only be narrowed while all of its values have fit
+        self.whole = True
+        self.midnight = True
+
+    def update(self, val):
+        if val is None:
+            return
+
+        self.count += 1
+
+        if self.candidates != ["DATE"]:
+            self._update_number(val)
+
+        else:
+            self.midnight = self.midnight and bool(MIDNIGHT_UTC.search(str(val)))
+
+    def _update_number(self, val):
+        if not self.whole:
+            return
+
+        try:
+            number = Decimal(str(val))
+
+        except InvalidOperation:
+            self.whole = False
+            return
+
+        if not number.is_finite() or number != number.to_integral_value():
+            self.whole = False
+            return
+
+        self.min = number if self.min is None else min(self.min, number)
+        self.max = number if self.max is None else max(self.max, number)
+
+    def narrowed_type(self):
+        """ The narrowest type which fits every value, or None to keep the column type """
+        if not self.count:
+            # nothing to go on
+            return None
+
+        if self.candidates == ["DATE"]:
+            # a date-only field's values should all be at midnight utc. if not, its
+            # values can't be cast to dates without shifting them
+            return "DATE" if self.midnight else None
+
+        if not self.whole:
+            return None
+
+        for data_type, lower, upper in INTEGER_TYPES:
+            if data_type in self.candidates and lower <= self.min and self.max <= upper:
+                return data_type
+
+        return None
+
+
+class TypeProfiler:
+    """
+    Profile a table's translated rows. Number, rating and auto increment columns
+    whose values are all whole numbers are narrowed to an integer type, unless their
+    format allows fractions, and the `TIMESTAMP WITH TIME ZONE` columns of date-only
+    fields to `DATE`. See `narrower_types`.
+
+    Usage:
+    >>> profiler = TypeProfiler(table)
+    >>> profiler.update(rows)  # for each batch of translated rows
+    >>> profiler.narrowed_types()
+    {<StandardField 'score'>: 'SMALLINT'}
+    """
+
+    def __repr__(self):
+        return f"<TypeProfiler {self.table.name_postgres}> ({self.rows} rows)"
+
+    def __init__(self, table):
+        self.table = table
+
+        self.rows = 0
+
+        self.columns = {
+            field.name_postgres: ColumnProfile(field)
+            for field in table.column_fields()
+            if field.data_type in ["NUMERIC", "TIMESTAMP WITH TIME ZONE"]
+            and narrower_types(field)
+        }
+
+    def update(self, rows):
+        for row in rows:
+            for name, column in self.columns.items():
+                column.update(row.get(name))
+
+        self.rows += len(rows)
+
+        return self
+
+    def narrowed_types(self):
+        """ Returns a dict of field: narrowed data type, for each column that can be narrowed """
+        narrowed = {}
+
+        for column in self.columns.values():
+            data_type = column.narrowed_type()
+
+            if data_type:
+                narrowed[column.field] = data_type
+
+        return narrowed
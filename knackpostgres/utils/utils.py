@@ -1,3 +1,9 @@
+import hashlib
+
+# postgres truncates identifiers longer than this many bytes
+MAX_PG_NAME_BYTES = 63
+
+
 
 def escape_single_quotes(string):
     return string.replace("\'", "\'\'")
@@ -54,3 +60,35 @@ def valid_pg_name(original_name):
         new_name = f"_{new_name}"
 
     return new_name
+
+def truncate_pg_name(name):
+    """
+    Shorten a generated name, e.g. of an index, to fit postgres' identifier limit.
+    Rather than leaving it to postgres to truncate, which can make two long names
+    collide, the name is cut short and suffixed with a hash of the whole name.
+    """
+    if len(name.encode()) <= MAX_PG_NAME_BYTES:
+        return name
+
+    suffix = hashlib.sha1(name.encode()).hexdigest()[:8]
+
+    prefix = name.encode()[: MAX_PG_NAME_BYTES - len(suffix) - 1]
+
+    # don't split a multibyte character
+    prefix = prefix.decode(errors="ignore")
+
+    return f"{prefix}_{suffix}"
+
+def chunks(iterable, size):
+    """ Yield successive lists of `size` items from any iterable """
+    chunk = []
+
+    for item in iterable:
+        chunk.append(item)
+
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
@@ -0,0 +1,59 @@
+import pytest
+
+# the package imports these at module level. test modules skip without them
+DEPENDENCIES = ["knackpy", "lark", "psycopg2", "requests"]
+
+
+def _field(key, name, type_, **kwargs):
+    return dict(
+        {"key": key, "name": name, "type": type_, "required": False, "unique": False},
+        **kwargs,
+    )
+
+
+METADATA = {
+    "id": "app1",
+    "name": "Test App",
+    "objects": [
+        {
+            "key": "object_1",
+            "name": "Projects",
+            "fields": [
+                _field("field_1", "Title", "short_text", required=True),
+                _field("field_2", "Budget", "number"),
+                _field(
+                    "field_3",
+                    "Owner",
+                    "connection",
+                    relationship={"has": "one", "belongs_to": "many", "object": "object_2"},
+                ),
+                _field("field_9", "Modified", "date_time"),
+            ],
+        },
+        {
+            "key": "object_2",
+            "name": "People",
+            "fields": [
+                _field("field_20", "Name", "short_text"),
+                _field(
+                    "field_22",
+                    "Mentees",
+                    "connection",
+                    relationship={"has": "many", "belongs_to": "one", "object": "object_1"},
+                ),
+                _field(
+                    "field_21",
+                    "Project Count",
+                    "count",
+                    format={"connection": "field_3"},
+                ),
+            ],
+        },
+    ],
+    "scenes": [],
+}
+
+
+@pytest.fixture
+def metadata():
+    return METADATA
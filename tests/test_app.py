@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import DEPENDENCIES
+
+for module in DEPENDENCIES:
+    pytest.importorskip(module)
+
+from knackpostgres import App  # noqa: E402
+
+
+def test_lookups_build_tables_on_a_fresh_app(metadata):
+    app = App("app1", metadata=metadata)
+
+    assert app.find_table_from_object_key("object_1").name_postgres == "projects"
+
+    app = App("app1", metadata=metadata)
+
+    assert app.find_field_from_field_key("field_2").name_postgres == "budget"
+
+    app = App("app1", metadata=metadata)
+
+    assert app.find_table_from_field_key("field_20", return_attr="name_postgres") == "people"
+
+
+def test_find_field_from_name(metadata):
+    app = App("app1", metadata=metadata, normalize_one_to_many=True)
+
+    owner = app.find_field_from_field_key("field_3")
+
+    assert app.find_field_from_name("projects", owner.name_postgres) is owner
+
+    # the child column of a normalized connection is added to the related table
+    # after the tables are indexed by key
+    child = app.find_field_from_field_key("field_22").child_field
+
+    assert app.find_field_from_name("projects", child.name_postgres) is child
+
+    assert app.find_field_from_name("projects", "nope") is None
+
+
+def test_formulae_are_handled_again_after_a_failure(metadata, monkeypatch):
+    app = App("app1", metadata=metadata)
+
+    def fail(self):
+        raise RuntimeError("formula parsing failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(App, "_store_formulas", fail)
+        app.stored_formulas = True
+
+        with pytest.raises(RuntimeError):
+            app._handle_formulae()
+
+    app._handle_formulae()
+
+    assert app._formulae_handled
+    assert app.find_field_from_field_key("field_21").stored
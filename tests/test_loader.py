@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import DEPENDENCIES
+
+for module in DEPENDENCIES:
+    pytest.importorskip(module)
+
+import psycopg2  # noqa: E402
+
+import knackpostgres.loader  # noqa: E402
+from knackpostgres import App, Loader  # noqa: E402
+from knackpostgres.exceptions.exceptions import ValidationError  # noqa: E402
+
+HIGH_WATER_MARK = datetime(2020, 3, 2, 12, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    """ Records the statements executed by a `Loader`, and answers its queries """
+
+    def __init__(self, statements, fail_on=None):
+        self.statements = statements
+        self.fail_on = fail_on
+        self.rowcount = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.fail_on and self.fail_on in sql:
+            raise psycopg2.ProgrammingError(f"syntax error at or near {self.fail_on}")
+
+        self.statements.append(" ".join(sql.split()))
+
+    def copy_expert(self, sql, file):
+        self.statements.append(sql)
+
+    def fetchone(self):
+        return (HIGH_WATER_MARK,)
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.fail_on = fail_on
+
+    def cursor(self):
+        return FakeCursor(self.statements, fail_on=self.fail_on)
+
+
+@pytest.fixture
+def loader(metadata):
+    # a fresh app, whose tables have not been built
+    loader = Loader(App("app1", metadata=metadata))
+    loader.conn = FakeConnection()
+    return loader
+
+
+def test_sync_fresh_app(loader, monkeypatch):
+    requests = []
+
+    def get_record_pages(app_id, api_key, obj, **kwargs):
+        requests.append((obj, kwargs["filters"]))
+        yield 1, [
+            {
+                "id": "rec1",
+                "field_1_raw": "a project",
+                "field_2_raw": 5,
+                "field_3_raw": [{"id": "person1"}],
+                "field_9_raw": {"iso_timestamp": "2020-03-02T12:00:00.000Z"},
+            }
+        ]
+
+    monkeypatch.setattr(knackpostgres.loader, "get_record_pages", get_record_pages)
+
+    assert loader.sync("myknackapikey", {"object_1": "field_9"}) == {"projects": 1}
+
+    # records modified since the day before the high-water mark are fetched
+    assert requests == [
+        (
+            "object_1",
+            [{"field": "field_9", "operator": "is after", "value": "03/01/2020"}],
+        )
+    ]
+
+    statements = loader.conn.statements
+
+    assert any(
+        sql.startswith("INSERT INTO projects") and "ON CONFLICT (knack_id)" in sql
+        for sql in statements
+    )
+
+    assert any("SELECT max(modified) FROM projects" in sql for sql in statements)
+
+    assert statements[-1] == "COMMIT;"
+
+
+@pytest.mark.parametrize(
+    "modified_fields",
+    [{"object_9": "field_9"}, {"object_1": "field_20"}, {"object_1": "field_2"}],
+)
+def test_sync_validates_modified_fields(loader, modified_fields):
+    with pytest.raises(ValidationError):
+        loader.sync("myknackapikey", modified_fields)
+
+
+def test_failed_phase_raises_its_own_error(loader):
+    loader.conn = FakeConnection(fail_on="BAD")
+
+    with pytest.raises(psycopg2.ProgrammingError, match="BAD"):
+        loader._run_phase("indexes", lambda: loader.execute("CREATE BAD INDEX;"))
+
+    # the phase was rolled back, and not recorded as complete
+    assert loader.conn.statements == ["BEGIN;", "ROLLBACK;"]
+    assert not loader.ledger.is_complete("indexes")
+
+    # outside of a transaction, statement errors are still only logged
+    loader.execute("CREATE BAD INDEX;")
+
+
+def test_failed_phase_is_named(loader, caplog):
+    loader.conn = FakeConnection(fail_on="BAD")
+
+    with pytest.raises(psycopg2.ProgrammingError):
+        loader._run_phase("connections", lambda: loader.execute("UPDATE BAD;"))
+
+    assert "The connections phase of the load failed" in caplog.text
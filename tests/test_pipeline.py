@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import DEPENDENCIES
+
+for module in DEPENDENCIES:
+    pytest.importorskip(module)
+
+from knackpostgres.utils.pipeline import Pipeline  # noqa: E402
+
+PAGES = 100
+
+
+def test_downstream_failure_stops_upstream_stages():
+    fetched = []
+
+    def fetch(table):
+        for page in range(PAGES):
+            fetched.append(page)
+            yield page
+
+    def write(page):
+        raise ValueError("COPY failed")
+
+    pipeline = Pipeline(
+        [("fetch", fetch, None), ("write", write, None)], queue_size=1
+    )
+
+    with pytest.raises(ValueError, match="COPY failed"):
+        pipeline.run(["projects", "people"])
+
+    # the fetch stage stops paging soon after the write stage fails, rather than
+    # fetching every page of every table
+    assert len(fetched) < PAGES
+
+
+def test_pipeline_runs_items_through_stages():
+    written = []
+
+    pipeline = Pipeline(
+        [
+            ("fetch", lambda table: (f"{table}_{page}" for page in range(3)), None),
+            ("write", written.append, None),
+        ]
+    )
+
+    stats = pipeline.run(["projects", "people"])
+
+    assert len(written) == 6
+    assert stats["fetch"].items == 2
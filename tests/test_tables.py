@@ -0,0 +1,36 @@
+import copy
+
+import pytest
+
+from conftest import DEPENDENCIES
+
+for module in DEPENDENCIES:
+    pytest.importorskip(module)
+
+from knackpostgres import App  # noqa: E402
+
+
+def test_knack_id_index_names_fit_postgres_limit(metadata):
+    metadata = copy.deepcopy(metadata)
+
+    # two tables whose names only differ beyond postgres' 63 byte limit
+    for obj, suffix in zip(metadata["objects"], ["projects", "people"]):
+        obj["name"] = f"{'a very long object name ' * 3}{suffix}"
+
+    app = App("app1", metadata=metadata)
+
+    names = set()
+
+    for obj in metadata["objects"]:
+        create, constraint = app.find_table_from_object_key(
+            obj["key"]
+        ).knack_id_index_sql()
+
+        name = create.split()[6]
+
+        assert len(name.encode()) <= 63
+        assert f"CONSTRAINT {name} UNIQUE USING INDEX {name};" in constraint
+
+        names.add(name)
+
+    assert len(names) == 2
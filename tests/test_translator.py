@@ -0,0 +1,32 @@
+import pytest
+
+from conftest import DEPENDENCIES
+
+for module in DEPENDENCIES:
+    pytest.importorskip(module)
+
+from knackpostgres import App, StreamingKnackTranslator  # noqa: E402
+
+RECORD = {"id": "rec1", "field_1_raw": "a project", "field_2_raw": 5}
+
+
+def test_column_plan_follows_field_changes(metadata):
+    app = App("app1", metadata=metadata)
+    table = app.find_table_from_object_key("object_1")
+
+    translator = StreamingKnackTranslator(table)
+
+    rows, _ = translator.translate_batch([RECORD])
+
+    assert rows[0]["budget"] == 5
+
+    # e.g. a field renamed after the plan was compiled
+    table.field_map["field_2"]["name"] = "cost"
+
+    rows, _ = translator.translate_batch([RECORD])
+
+    assert rows[0]["cost"] == 5
+    assert "budget" not in rows[0]
+
+    # other translators of the table share the recompiled plan
+    assert StreamingKnackTranslator(table).column_plan is translator.column_plan